@@ -0,0 +1,107 @@
+"""
+compares the sqlite backed :class:`jiracli.cache.CachedData` with the
+previous layout of one pickle file per entry in the cache directory.
+
+each "invocation" starts from an empty in-process memo (and a fresh
+database connection) and reads a handful of entries, the way a single
+jira-cli command does.
+
+usage: python -m benchmarks.bench_cache [entries] [invocations]
+"""
+from contextlib import closing
+import glob
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import time
+
+import jiracli.cache
+from jiracli.cache import CachedData
+
+READS_PER_INVOCATION = 10
+
+
+class DirectoryCache(object):
+    # the per-file layout CachedData used before.
+    def __init__(self, directory, name):
+        self.path = os.path.join(directory, name + '.cache')
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def update(self, data):
+        with closing(open(self.path, 'wb')) as fp:
+            fp.write(pickle.dumps(data))
+
+    def get(self):
+        try:
+            with closing(open(self.path, 'rb')) as fp:
+                timestamp = os.stat(self.path).st_mtime
+                if (time.time() - timestamp) < jiracli.cache.CACHE_DURATION:
+                    return pickle.loads(fp.read())
+        except IOError:
+            return None
+
+
+def entry(i):
+    return {"id": str(i), "name": "Status %d" % i, "description": "status number %d" % i}
+
+
+def run(make, reset, count, invocations):
+    start = time.time()
+    for i in range(count):
+        make("status%d" % i, "status").update(entry(i))
+    writes = time.time() - start
+
+    start = time.time()
+    for n in range(invocations):
+        reset()
+        for i in range(READS_PER_INVOCATION):
+            make("status%d" % ((n * READS_PER_INVOCATION + i) % count), "status").get()
+    reads = time.time() - start
+    return writes, reads
+
+
+def main(count=2000, invocations=500):
+    directory = tempfile.mkdtemp()
+
+    def directory_invalidate():
+        for path in glob.glob(os.path.join(directory, "status*.cache")):
+            os.unlink(path)
+
+    legacy = run(
+        lambda name, namespace: DirectoryCache(directory, name), lambda: None, count, invocations
+    )
+    start = time.time()
+    directory_invalidate()
+    legacy += (time.time() - start,)
+
+    jiracli.cache.CACHE_DIR = tempfile.mkdtemp()
+
+    def reset():
+        CachedData.memo.clear()
+        for connection in jiracli.cache.CONNECTIONS.values():
+            connection.close()
+        jiracli.cache.CONNECTIONS.clear()
+
+    single = run(
+        lambda name, namespace: CachedData(name, namespace=namespace), reset, count, invocations
+    )
+    start = time.time()
+    jiracli.cache.clear_namespace("status")
+    single += (time.time() - start,)
+
+    print("%d entries, %d invocations reading %d entries each" % (
+        count, invocations, READS_PER_INVOCATION
+    ))
+    for label, (writes, reads, invalidate) in (("per-file", legacy), ("sqlite", single)):
+        print("%-10s writes: %.3fs reads: %.3fs (%.1fus/read) invalidate: %.4fs" % (
+            label, writes, reads, reads * 1e6 / (invocations * READS_PER_INVOCATION), invalidate
+        ))
+    shutil.rmtree(directory)
+    jiracli.cache.clear_cache()
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,95 @@
+"""
+converts synthetic search results into cleaned issues, comparing
+:meth:`jiracli.bridge.rest.JiraRestBridge.clean_raw_issue` (which works
+on the json) with building the jira.resources objects of each issue and
+walking their fields, as clean_issue did before.
+
+usage: python -m benchmarks.bench_clean_issue [issues]
+"""
+import sys
+import tempfile
+import time
+
+import mock
+from jira.resources import Issue, Resource
+
+import jiracli.cache
+from jiracli.bridge.rest import JiraRestBridge
+from jiracli.utils import Config, map_rest_resource
+
+URL = "http://jira.local/rest/api/2"
+
+
+def legacy_clean_issue(bridge, issue):
+    # the resource based conversion clean_raw_issue replaced.
+    _issue = {}
+    for k, v in issue.fields.__dict__.items():
+        if isinstance(v, Resource):
+            _issue[k] = map_rest_resource(v)
+        elif v is not None:
+            _issue[k] = v
+    _issue['key'] = issue.key
+    _issue['type'] = map_rest_resource(_issue['issuetype'])
+    comment = _issue.get('comment')
+    comments = getattr(comment, 'comments', None)
+    if comments is not None and len(comments) >= getattr(comment, 'total', 0):
+        _issue['comments'] = [bridge.clean_comment(k) for k in comments]
+    return _issue
+
+
+def user(name):
+    return {"name": name, "displayName": name.title(), "self": "%s/user?username=%s" % (URL, name)}
+
+
+def raw_issue(i):
+    fields = {
+        "issuetype": {"id": "1", "name": "Bug", "self": "%s/issuetype/1" % URL},
+        "status": {"id": str(i % 5), "name": "Status", "self": "%s/status/%d" % (URL, i % 5)},
+        "priority": {"id": "3", "name": "Major", "self": "%s/priority/3" % URL},
+        "project": {"id": "10", "key": "TP", "name": "Test", "self": "%s/project/10" % URL},
+        "assignee": user("alice"), "reporter": user("bob"), "creator": user("bob"),
+        "components": [
+            {"id": str(k), "name": "component %d" % k, "self": "%s/component/%d" % (URL, k)}
+            for k in range(2)
+        ],
+        "fixVersions": [{"id": "8", "name": "1.0", "self": "%s/version/8" % URL}],
+        "labels": ["a", "b"],
+        "summary": "summary of issue %d" % i,
+        "description": "description of issue %d\n" % i * 20,
+        "created": "2014-08-30T00:00:00.000+0000", "updated": "2014-08-31T00:00:00.000+0000",
+        "progress": {"progress": 0, "total": 0},
+        "votes": {"votes": 0, "hasVoted": False, "self": "%s/issue/TP-%d/votes" % (URL, i)},
+        "comment": {"comments": [
+            {"author": user("carol"), "body": "comment %d" % k, "created": "2014-08-30",
+             "self": "%s/issue/%d/comment/%d" % (URL, i, k)}
+            for k in range(3)
+        ], "total": 3, "maxResults": 3, "startAt": 0},
+        "resolution": None, "duedate": None,
+    }
+    fields.update(("customfield_%d" % k, None if k % 2 else "value %d" % k) for k in range(20))
+    return {"key": "TP-%d" % i, "id": str(i), "self": "%s/issue/%d" % (URL, i), "fields": fields}
+
+
+def main(count=10000):
+    jiracli.cache.CACHE_DIR = tempfile.mkdtemp()
+    with mock.patch("jiracli.bridge.JiraBridge._check_redirect", side_effect=lambda url: url):
+        bridge = JiraRestBridge("http://jira.local", Config(tempfile.mktemp()))
+    issues = [raw_issue(i) for i in range(count)]
+
+    start = time.time()
+    for raw in issues:
+        legacy_clean_issue(bridge, Issue({}, None, raw))
+    legacy = time.time() - start
+
+    start = time.time()
+    for raw in issues:
+        bridge.clean_raw_issue(raw)
+    direct = time.time() - start
+
+    print("%d issues" % count)
+    print("jira.resources: %.2fs (%.1fus/issue)" % (legacy, legacy * 1e6 / count))
+    print("raw json      : %.2fs (%.1fus/issue)" % (direct, direct * 1e6 / count))
+
+
+if __name__ == "__main__":
+    main(*[int(k) for k in sys.argv[1:2]])
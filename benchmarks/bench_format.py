@@ -0,0 +1,119 @@
+"""
+renders synthetic issues through a ``--format`` template, comparing a
+precompiled :class:`jiracli.utils.FormatTemplate` with the previous
+implementation (a copy of it), which re-parsed the format string for
+every issue.
+
+usage: python -m benchmarks.bench_format [issues]
+"""
+import re
+import sys
+import tempfile
+import time
+
+import mock
+import termcolor
+
+import jiracli.cache
+from jiracli.bridge.rest import JiraRestBridge
+from jiracli.utils import Config, FormatTemplate
+
+FORMAT = "%key [%status] %priority %type: %summary (%assignee / %reporter)"
+
+
+def legacy_format(bridge, issue, formatter):
+    # JiraBridge.format_issue as it rendered --format strings before
+    # FormatTemplate: the status (and its color) looked up for every
+    # issue, the metadata lambdas built per call and the regex scan and
+    # str.replace loop over the tokens.
+    status_color = "blue"
+    status_from_id = bridge.object_from_key(
+        issue.setdefault('status', '1'),
+        bridge.get_statuses
+    )
+    if not status_from_id:
+        status_from_id = bridge.get_status(issue.setdefault('status', '1'))
+
+    status_string = (status_from_id and status_from_id['name']) or 'unknown'
+
+    status_category = status_from_id.get('statusCategory', {})
+    if status_category:
+        status_color = status_category.get('colorName')
+        if status_color:
+            status_color = status_color.split("-")[0]
+        if status_color not in termcolor.COLORS:
+            status_color = None
+    if not status_color:
+        if status_string.lower() in ["resolved", "closed", "done"]:
+            status_color = "green"
+        elif status_string.lower() in ["open", "unassigned", "reopened", "to do"]:
+            status_color = "red"
+    list_fields = set(['versions', 'fixversions'])
+
+    special_fields = {
+        "status": lambda value: bridge.object_from_key(value, bridge.get_statuses),
+        "priority": lambda value: bridge.object_from_key(value, bridge.get_priorities),
+        "type": lambda value: (
+            bridge.object_from_key(value, bridge.get_issue_types) or
+            bridge.object_from_key(value, bridge.get_subtask_issue_types)
+        )
+    }
+    special_field_fallback = {
+        "status": bridge.get_status,
+        "type": bridge.get_issue_type
+    }
+    groups = re.compile(r"(%([\w]+))").findall(formatter)
+    ret_str = formatter
+    for k, v in groups:
+        if v.lower() in special_fields.keys():
+            key = issue[v.lower()]
+            data = special_fields[v.lower()](key).get("name")
+            if not data and v.lower() in special_field_fallback:
+                data = special_field_fallback[v.lower()](key).get("name")
+            ret_str = ret_str.replace(k, data)
+        elif v.lower() in list_fields:
+            fix_versions = ", ".join(v.name for v in issue.get('fixVersions', []))
+            ret_str = ret_str.replace(k, fix_versions)
+        else:
+            ret_str = ret_str.replace(k, str(issue.setdefault(v.lower(), "")))
+    return ret_str
+
+
+def main(count=100000):
+    jiracli.cache.CACHE_DIR = tempfile.mkdtemp()
+    with mock.patch("jiracli.bridge.JiraBridge._check_redirect", side_effect=lambda url: url):
+        bridge = JiraRestBridge("http://jira.local", Config(tempfile.mktemp()))
+    statuses = dict(("status %d" % i, {"id": str(i), "name": "Status %d" % i}) for i in range(200))
+    priorities = dict(("priority %d" % i, {"id": str(i), "name": "Priority %d" % i}) for i in range(10))
+    types = dict(("type %d" % i, {"id": str(i), "name": "Type %d" % i}) for i in range(100))
+    bridge.get_statuses = lambda: statuses
+    bridge.get_priorities = lambda: priorities
+    bridge.get_issue_types = lambda: types
+    bridge.get_subtask_issue_types = lambda: {}
+    issues = [
+        {
+            "key": "TP-%d" % i, "status": str(i % 200), "priority": str(i % 10),
+            "type": str(i % 100), "summary": "summary of issue %d" % i,
+            "assignee": "assignee", "reporter": "reporter"
+        }
+        for i in range(count)
+    ]
+
+    start = time.time()
+    for issue in issues:
+        legacy_format(bridge, issue, FORMAT)
+    legacy = time.time() - start
+
+    start = time.time()
+    template = FormatTemplate(FORMAT)
+    for issue in issues:
+        bridge.format_issue(issue, formatter=template)
+    compiled = time.time() - start
+
+    print("%d issues with %r" % (count, FORMAT))
+    print("re-parsed per issue : %.2fs (%.1fus/issue)" % (legacy, legacy * 1e6 / count))
+    print("precompiled template: %.2fs (%.1fus/issue)" % (compiled, compiled * 1e6 / count))
+
+
+if __name__ == "__main__":
+    main(*[int(k) for k in sys.argv[1:2]])
@@ -0,0 +1,75 @@
+"""
+compares the cpu time and peak memory of reading a large jql search
+through jira.client (building the resources of each issue and cleaning
+them as the rest bridge used to) with the bridge's own search over the
+shared session. The fake jira server runs in a separate process so that
+only the client side is measured.
+
+usage: python -m benchmarks.bench_lean_search [issues]
+"""
+import multiprocessing
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import jiracli.cache
+from jiracli.bridge.rest import JiraRestBridge, SEARCH_PAGE_SIZE
+from jiracli.utils import Config
+from benchmarks.bench_clean_issue import legacy_clean_issue, raw_issue
+from benchmarks.fake_jira import FakeJiraServer
+
+QUERY = "project=TP order by key"
+
+
+def serve(issues, urls, stop):
+    with FakeJiraServer(issues=0, latency=0, max_results=SEARCH_PAGE_SIZE) as server:
+        server.issues = [raw_issue(i) for i in range(issues)]
+        urls.put(server.url)
+        stop.wait()
+
+
+def legacy_search(bridge, total):
+    issues = []
+    for start in range(0, total, SEARCH_PAGE_SIZE):
+        for issue in bridge.jira.search_issues(QUERY, startAt=start, maxResults=SEARCH_PAGE_SIZE):
+            issues.append(legacy_clean_issue(bridge, issue))
+    return issues
+
+
+def measure(fn):
+    start = time.process_time()
+    result = fn()
+    elapsed = time.process_time() - start
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main(issues=5000):
+    jiracli.cache.CACHE_DIR = tempfile.mkdtemp()
+    urls, stop = multiprocessing.Queue(), multiprocessing.Event()
+    server = multiprocessing.Process(target=serve, args=(issues, urls, stop))
+    server.start()
+    try:
+        config = Config(tempfile.mktemp())
+        config.search_concurrency = "1"
+        bridge = JiraRestBridge(urls.get(), config)
+        bridge.login(basic_auth=("user", "password"))
+        # warm up the connection (and jira.client's lookup of the field names).
+        bridge.jira.search_issues(QUERY, maxResults=1)
+        legacy, legacy_cpu, legacy_peak = measure(lambda: legacy_search(bridge, issues))
+        lean, lean_cpu, lean_peak = measure(lambda: list(bridge.search_issues_jql(QUERY)))
+    finally:
+        stop.set()
+        server.join()
+    assert [k["key"] for k in legacy] == [k["key"] for k in lean]
+    print("%d issues" % issues)
+    print("jira.client : %.2fs cpu, %.1fMB peak" % (legacy_cpu, legacy_peak / 1e6))
+    print("lean search : %.2fs cpu, %.1fMB peak" % (lean_cpu, lean_peak / 1e6))
+
+
+if __name__ == "__main__":
+    main(*[int(k) for k in sys.argv[1:2]])
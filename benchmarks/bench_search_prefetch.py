@@ -0,0 +1,42 @@
+"""
+compares sequential and concurrent paging of a large jql search
+against a local fake jira server.
+
+usage: python -m benchmarks.bench_search_prefetch [issues] [latency]
+"""
+import sys
+import tempfile
+import time
+
+import jiracli.cache
+from jiracli.bridge.rest import JiraRestBridge
+from jiracli.utils import Config
+from benchmarks.fake_jira import FakeJiraServer
+
+
+def run(server, concurrency):
+    config = Config(tempfile.mktemp())
+    config.search_concurrency = str(concurrency)
+    bridge = JiraRestBridge(server.url, config)
+    bridge.login(basic_auth=("user", "password"))
+    start = time.time()
+    keys = [issue["key"] for issue in bridge.search_issues_jql("project=TP order by key")]
+    elapsed = time.time() - start
+    assert keys == [k["key"] for k in server.issues]
+    return elapsed
+
+
+def main(issues=2000, latency=0.05):
+    jiracli.cache.CACHE_DIR = tempfile.mkdtemp()
+    with FakeJiraServer(issues=issues, latency=latency) as server:
+        baseline = run(server, 1)
+        print("%d issues, %.0fms latency" % (issues, latency * 1000))
+        print("concurrency  1: %.2fs" % baseline)
+        for concurrency in (2, 4, 8):
+            elapsed = run(server, concurrency)
+            print("concurrency %2d: %.2fs (%.1fx)" % (concurrency, elapsed, baseline / elapsed))
+
+
+if __name__ == "__main__":
+    main(*[int(sys.argv[1]) if len(sys.argv) > 1 else 2000] +
+         [float(k) for k in sys.argv[2:3]])
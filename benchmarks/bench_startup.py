@@ -0,0 +1,63 @@
+"""
+measures the cold start of jira-cli subcommands that don't need to talk
+to jira, each in a fresh interpreter (with a scratch HOME), along with
+the import time of jiracli.interface as reported by ``-X importtime``.
+
+usage: python -m benchmarks.bench_startup [runs]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+SCRIPT = """
+import sys
+from jiracli.interface import cli
+try:
+    cli(sys.argv[1:])
+except SystemExit:
+    pass
+print([m for m in %r if m in sys.modules])
+"""
+COMMANDS = [
+    ["--version"],
+    ["clear_cache"],
+    ["view", "--help"],
+]
+PROTOCOL_MODULES = ["suds", "jira", "keyring", "requests"]
+
+
+def run(args, env, *flags):
+    start = time.time()
+    proc = subprocess.Popen(
+        [sys.executable] + list(flags) + ["-c", SCRIPT % PROTOCOL_MODULES] + args,
+        env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    out, err = proc.communicate()
+    return time.time() - start, out.decode("utf-8"), err.decode("utf-8")
+
+
+def import_time(env):
+    _, _, err = run(["--version"], env, "-X", "importtime")
+    for line in err.splitlines():
+        if line.rstrip().endswith("| jiracli.interface"):
+            return int(line.split("|")[1]) / 1000.0
+
+
+def main(runs=5):
+    env = dict(os.environ, HOME=tempfile.mkdtemp())
+    print("import jiracli.interface: %.1fms" % import_time(env))
+    for args in COMMANDS:
+        timings = []
+        for _ in range(runs):
+            elapsed, out, _ = run(args, env)
+            timings.append(elapsed)
+        loaded = out.strip().splitlines()[-1] if out.strip() else "?"
+        print("jira-cli %-12s: %.1fms (protocol modules loaded: %s)" % (
+            " ".join(args), min(timings) * 1000, loaded
+        ))
+
+
+if __name__ == "__main__":
+    main(*[int(k) for k in sys.argv[1:2]])
@@ -0,0 +1,87 @@
+"""
+a minimal, threaded stand-in for the jira rest api used by the
+benchmarks. Every response is delayed by ``latency`` seconds to
+approximate the round trip to a real server.
+"""
+import json
+import threading
+import time
+
+from six.moves import BaseHTTPServer, socketserver
+from six.moves.urllib import parse
+
+
+def make_issue(i):
+    return {
+        "id": str(10000 + i),
+        "key": "TP-%d" % i,
+        "fields": {
+            "summary": "issue number %d" % i,
+            "description": "description of issue %d\n" % i * 5,
+            "issuetype": {"id": "1", "name": "Bug", "subtask": False},
+            "status": {"id": "1", "name": "Open"},
+            "priority": {"id": "3", "name": "Major"},
+            "reporter": {"name": "reporter", "displayName": "Reporter"},
+            "assignee": {"name": "assignee", "displayName": "Assignee"},
+            "created": "2014-08-30T03:25:43.000+0000",
+            "updated": "2014-08-30T03:25:43.000+0000",
+        }
+    }
+
+
+class FakeJiraHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        url = parse.urlparse(self.path)
+        params = dict(parse.parse_qsl(url.query))
+        time.sleep(self.server.latency)
+        with self.server.lock:
+            self.server.requests.append(self.path)
+        if url.path.endswith("/search"):
+            start = int(params.get("startAt", 0))
+            size = min(int(params.get("maxResults", 50)), self.server.max_results)
+            end = min(start + size, len(self.server.issues))
+            body = {
+                "startAt": start,
+                "maxResults": size,
+                "total": len(self.server.issues),
+                "issues": self.server.issues[start:end]
+            }
+        else:
+            body = {}
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json;charset=UTF-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class FakeJiraServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, issues=1000, latency=0.05, max_results=100):
+        BaseHTTPServer.HTTPServer.__init__(self, ("127.0.0.1", 0), FakeJiraHandler)
+        self.issues = [make_issue(i) for i in range(issues)]
+        self.latency = latency
+        self.max_results = max_results
+        self.lock = threading.Lock()
+        self.requests = []
+
+    @property
+    def url(self):
+        return "http://%s:%d" % self.server_address
+
+    def __enter__(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
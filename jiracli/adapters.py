@@ -0,0 +1,25 @@
+"""
+
+"""
+from requests.adapters import HTTPAdapter
+from jiracli import cache
+
+
+class RevalidatingAdapter(HTTPAdapter):
+    """
+    transport adapter of the shared session that, while a cached entry
+    is being refreshed, sends the validators stored with it along and
+    records those of the responses (see :func:`jiracli.cache.refresh`).
+    """
+    def send(self, request, **kwargs):
+        state = cache.current_revalidation()
+        if state is None or request.method != 'GET':
+            return super(RevalidatingAdapter, self).send(request, **kwargs)
+        conditions = state.conditions(request.url)
+        request.headers.update(conditions)
+        response = super(RevalidatingAdapter, self).send(request, **kwargs)
+        if conditions and response.status_code == 304:
+            response.close()
+            raise cache.NotModified(request.url)
+        state.record(request.url, response.headers)
+        return response
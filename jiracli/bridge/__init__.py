@@ -2,41 +2,364 @@
 
 """
 import abc
-import re
-import requests
+from collections import deque
+from functools import partial
+import hashlib
+import importlib
+from itertools import islice
+import json
+from multiprocessing.pool import ThreadPool
+import os
+import sys
+import threading
+import time
+import types
 import termcolor
 from requests import RequestException
 import six
 from six.moves.urllib import parse
-from jiracli.cli import colorfunc
-from jiracli.utils import COLOR
+from jiracli import cache
+from jiracli.cache import cached
+from jiracli.errors import UsageError
+from jiracli.utils import COLOR, Config, FormatTemplate, chunked, get_session, colorfunc
+
+CONCURRENCY = 4
+# seconds for which a persisted login is trusted without asking jira.
+SESSION_DURATION = 60*30
+# guards the read-modify-write of the sessions file by the threads of
+# this process.
+SESSION_LOCK = threading.Lock()
+# protocol -> (module, class) of the bridge implementing it. The modules
+# are only imported when the protocol is used.
+BRIDGES = {
+    'soap': ('jiracli.bridge.soap', 'JiraSoapBridge'),
+    'rest': ('jiracli.bridge.rest', 'JiraRestBridge'),
+    'rest-async': ('jiracli.bridge.rest_async', 'JiraAsyncRestBridge'),
+}
+# the python version required by the bridges that don't support all of
+# them.
+BRIDGE_PYTHON = {
+    'rest-async': (3, 6),
+}
+KEYS_PER_QUERY = 50
+
+# fields rendered by name through the metadata getters (in order of lookup),
+# the getters to fall back on when they aren't found and fields rendered
+# as comma separated version names.
+SPECIAL_FIELDS = {
+    "status": ("get_statuses",),
+    "priority": ("get_priorities",),
+    "type": ("get_issue_types", "get_subtask_issue_types")
+}
+SPECIAL_FIELD_FALLBACK = {
+    "status": "get_status",
+    "type": "get_issue_type"
+}
+LIST_FIELDS = set(['versions', 'fixversions'])
+# fields of the issues read by format_issue in each display mode (the
+# key is always returned), and those of the sub-tasks it lists.
+DISPLAY_FIELDS = {
+    -1: ['summary', 'status'],
+    0: ['summary', 'status', 'reporter', 'assignee'],
+    1: ['summary', 'status', 'reporter', 'assignee', 'description', 'priority', 'type',
+        'parent', 'comments'],
+    2: ['summary', 'status', 'reporter', 'assignee', 'description'],
+}
+CHILD_FIELDS = ['summary', 'type', 'parent']
+
+
+def issue_value(issue, field):
+    """
+    the value of ``field`` in ``issue`` matched regardless of case, as
+    the tokens of ``--format`` templates are lowercased (None if the
+    issue doesn't have it).
+    """
+    if field in issue:
+        return issue[field]
+    for key, value in issue.items():
+        if key.lower() == field:
+            return value
+    return None
+
+
+@cached('redirect')
+def resolve_redirect(url):
+    """
+    returns ``url`` with the scheme and host it redirects to (e.g. when
+    moving from http to https), or None if it can't be reached. The path
+    is kept as is since jira redirects its root to the dashboard.
+    """
+    try:
+        resp = get_session().get(url, allow_redirects=False)
+    except RequestException:
+        return None
+    if resp.status_code in [301, 302] and 'location' in resp.headers:
+        location = parse.urlparse(parse.urljoin(url, resp.headers['location']))
+        return parse.urlunparse(
+            (location.scheme, location.netloc, parse.urlparse(url).path, '', '', '')
+        )
+    return url
+
+
+def token_user(access_token):
+    """
+    identifies the user of an oauth ``access_token`` without exposing it.
+    """
+    return 'oauth:' + hashlib.md5(access_token.encode('utf-8')).hexdigest()[:16]
+
+
+def auth_user(auth_kwargs):
+    """
+    the user that ``auth_kwargs`` (as accepted by :meth:`JiraBridge.login`)
+    authenticate as, or None if it can't be told.
+    """
+    for method in ('basic_auth', 'auth'):
+        if method in auth_kwargs:
+            return auth_kwargs[method][0]
+    if 'oauth' in auth_kwargs:
+        return token_user(auth_kwargs['oauth']['access_token'])
+    return None
 
 
 @six.add_metaclass(abc.ABCMeta)
 class JiraBridge(object):
+    protocol = None
 
     def __init__(self, base_url, config, persist=True):
+        # cache durations can be overridden per namespace in the
+        # [cache] section of the config file.
+        cache.configure(Config(config.cfg_path, section='cache').items())
         self.base_url = self._check_redirect(base_url)
         self.config = config
         self.persist = persist
+        self.indexes = {}
+        # the user the cached data is fetched for (updated on login).
+        self.user = config.username or (
+            config.oauth_access_token and token_user(config.oauth_access_token)
+        ) or ''
+        # called (by the bridges) to obtain a freshly logged in bridge
+        # when a resumed session turns out to have expired.
+        self.reauthenticate = None
 
     def _check_redirect(self, url):
-        try:
-            resp = requests.get( url, allow_redirects = False )
-            if resp.status_code in [301,302]:
-                return resp.headers['location']
-        except RequestException:
-            return None
-        finally:
-            return url
+        return resolve_redirect(url) or url
 
     def __repr__(self):
         return "%s(%s)" % (self.__class__.__name__, self.base_url)
 
+    @property
+    def cache_scope(self):
+        """
+        identifies the protocol, server and user that data cached by this
+        bridge belongs to (see :func:`jiracli.cache.cached`).
+        """
+        return "%s %s %s" % (self.protocol, self.base_url, self.user)
+
+    @property
+    def concurrency(self):
+        """
+        the maximum number of requests to issue in parallel. Read from
+        the raw option, as the config turns 0 and 1 into booleans.
+        """
+        value = self.config.items().get('search_concurrency')
+        if not value:
+            return CONCURRENCY
+        try:
+            concurrency = int(value)
+        except ValueError:
+            concurrency = 0
+        if concurrency < 1:
+            raise UsageError("search_concurrency must be a positive number of requests (not %s)" % value)
+        return concurrency
+
+    @property
+    def session_path(self):
+        """
+        the file (next to the configuration, readable by the user only)
+        holding the sessions persisted by :meth:`save_session`. They are
+        kept out of the cache so that evicting, clearing or copying it
+        neither logs the user out nor hands the session out.
+        """
+        return os.path.splitext(self.config.cfg_path)[0] + '.sessions'
+
+    def sessions(self):
+        """
+        the unexpired sessions persisted by :meth:`save_session`, by
+        :attr:`cache_scope`.
+        """
+        try:
+            with open(self.session_path, 'rb') as fp:
+                sessions = json.loads(fp.read().decode('utf-8'))
+        except (IOError, OSError, ValueError):
+            return {}
+        now = time.time()
+        return dict((k, v) for k, v in sessions.items() if v.get('expires', 0) > now)
+
+    def update_sessions(self, data=None):
+        """
+        replaces (or with ``data`` None, forgets) the session persisted
+        for this bridge's server and user.
+        """
+        with SESSION_LOCK:
+            sessions = self.sessions()
+            if data is None and self.cache_scope not in sessions:
+                return
+            sessions.pop(self.cache_scope, None)
+            if data is not None:
+                sessions[self.cache_scope] = data
+            if not os.path.isdir(os.path.dirname(self.session_path)):
+                os.makedirs(os.path.dirname(self.session_path))
+            cache.atomic_write(self.session_path, json.dumps(sessions).encode('utf-8'))
+
+    def save_session(self, **data):
+        """
+        persists ``data`` (cookies, tokens) so that the next invocation
+        can :meth:`resume` the session instead of logging in again.
+        """
+        data['expires'] = time.time() + (self.config.session_duration or SESSION_DURATION)
+        self.update_sessions(data)
+
+    def clear_session(self):
+        """
+        forgets the session persisted by :meth:`save_session` (once it
+        has expired on the server).
+        """
+        self.update_sessions()
+
+    def load_session(self):
+        """
+        returns the data persisted by :meth:`save_session` or None if
+        there is none or it has expired.
+        """
+        return self.sessions().get(self.cache_scope)
+
+    def resume(self):
+        """
+        restores the session persisted by a recent login without
+        contacting jira. returns False if there is none to restore.
+        """
+        return False
+
+    def warm_cache(self, projects=()):
+        """
+        generator that fetches (concurrently) the data of every cached
+        getter that takes no arguments, and the components and versions
+        of ``projects``, so that the cache is filled in one go. yields
+        the name of each getter along with the error it failed with (or
+        None) as soon as it completes.
+        """
+        getters = [
+            (name, getattr(self, name)) for name in dir(type(self))
+            if getattr(getattr(type(self), name), 'cache_arguments', None) == 1
+        ]
+        for project in projects:
+            getters.append(("get_components %s" % project, partial(self.get_components, project)))
+            getters.append(("list_versions %s" % project, partial(self.list_versions, project)))
+
+        def fetch(named_getter):
+            name, getter = named_getter
+            try:
+                getter()
+            except Exception as e:
+                return name, e
+            return name, None
+        pool = ThreadPool(min(self.concurrency, len(getters)))
+        try:
+            for result in pool.imap_unordered(fetch, getters):
+                yield result
+        finally:
+            pool.terminate()
+
+    def fetch_in_order(self, fetch, arguments):
+        """
+        generator that yields ``fetch(argument)`` for each of
+        ``arguments``, in order, while up to :attr:`concurrency` of the
+        following calls run ahead on a thread pool.
+        """
+        arguments = iter(arguments)
+        concurrency = self.concurrency
+        pool = ThreadPool(concurrency)
+        try:
+            # keep at most ``concurrency`` results in flight so that memory
+            # stays bounded when the consumer is slower than the server.
+            pending = deque(
+                pool.apply_async(fetch, (argument,)) for argument in islice(arguments, concurrency)
+            )
+            while pending:
+                result = pending.popleft().get()
+                for argument in islice(arguments, 1):
+                    pending.append(pool.apply_async(fetch, (argument,)))
+                yield result
+        finally:
+            pool.terminate()
+
+    def display_fields(self, mode=0, formatter=None, comments_only=False):
+        """
+        returns the fields of an issue that :meth:`format_issue` reads
+        to display it with the same arguments, so that searches can
+        leave out the others.
+        """
+        if formatter:
+            if not isinstance(formatter, FormatTemplate):
+                formatter = FormatTemplate(formatter)
+            return [field for field in formatter.fields if field != 'key']
+        if comments_only:
+            return DISPLAY_FIELDS[1]
+        return DISPLAY_FIELDS[max(-1, min(mode, 2))]
+
+    def get_issues(self, issue_ids, fields=None):
+        """
+        generator that yields the issues ``issue_ids`` (skipping those
+        that aren't found) in the same order, fetching up to
+        :attr:`concurrency` of them at a time. ``fields`` (if given)
+        restricts the fields returned, where the protocol supports it.
+        """
+        for issue in self.fetch_in_order(partial(self.get_issue, fields=fields), issue_ids):
+            if issue is not None:
+                yield issue
+
+    def add_comments(self, issues):
+        """
+        attaches the comments of each issue in ``issues`` (under the
+        ``comments`` key) to the issues that don't already carry them,
+        fetching them concurrently.
+        """
+        missing = [issue for issue in issues if 'comments' not in issue]
+        if missing:
+            pool = ThreadPool(min(self.concurrency, len(missing)))
+            try:
+                comments = pool.map(self.get_issue_comments, [issue['key'] for issue in missing])
+            finally:
+                pool.terminate()
+            for issue, issue_comments in zip(missing, comments):
+                issue['comments'] = issue_comments
+        return issues
+
+    def add_children(self, issues):
+        """
+        attaches the sub-tasks of each issue in ``issues`` (under the
+        ``children`` key) using one ``parent in (...)`` search per
+        :data:`KEYS_PER_QUERY` issues.
+        """
+        children = dict((issue['key'], []) for issue in issues)
+        for keys in chunked([issue['key'] for issue in issues], KEYS_PER_QUERY):
+            for child in self.search_issues_jql(
+                "parent in (%s)" % ",".join(keys), fields=CHILD_FIELDS
+            ):
+                if child.get('parent') in children:
+                    children[child['parent']].append(child)
+        for issue in issues:
+            issue['children'] = children[issue['key']]
+        return issues
+
     def format_issue(self, issue, mode=0, formatter=None, comments_only=False):
+        if formatter:
+            if not isinstance(formatter, FormatTemplate):
+                formatter = FormatTemplate(formatter)
+            return formatter.render(lambda field: self.format_field(issue, field))
         fields = {}
         status_color = "blue"
-        status_from_id = JiraBridge.object_from_key(
+        status_from_id = self.object_from_key(
             issue.setdefault('status', '1'),
             self.get_statuses
         )
@@ -57,44 +380,10 @@ class JiraBridge(object):
                 status_color = "green"
             elif status_string.lower() in ["open", "unassigned", "reopened", "to do"]:
                 status_color = "red"
-        list_fields = set(['versions', 'fixversions'])
-
-        special_fields = {
-            "status": self.get_statuses,
-            "priority": self.get_priorities,
-            "type": lambda: dict(list(self.get_issue_types().items()) + list(self.get_subtask_issue_types().items()))
-        }
-        special_field_fallback = {
-            "status": self.get_status,
-            "type": self.get_issue_type
-        }
-        if formatter:
-            groups = re.compile("(%([\w]+))").findall(formatter)
-            ret_str = formatter
-            for k, v in groups:
-                if v.lower() in special_fields.keys():
-                    key = issue[v.lower()]
-                    data = "" or JiraBridge.object_from_key(key, special_fields[v.lower()]).get("name")
-                    if not data and v.lower() in special_field_fallback:
-                        data = special_field_fallback[v.lower()](key).get("name")
-                    ret_str = ret_str.replace(k, data)
-                elif v.lower() in list_fields:
-                    fix_versions = ", ".join(v.name for v in issue.get('fixVersions', []))
-                    ret_str = ret_str.replace(k, fix_versions)
-                else:
-                    ret_str = ret_str.replace(k, str(issue.setdefault(v.lower(), "")))
-            return ret_str
-
         if mode >= 0:
             # minimal
             fields["issue"] = issue["key"]
-            fields["status"] = colorfunc(
-                JiraBridge.object_from_key(
-                    issue["status"],
-                    self.get_statuses
-                ).get("name", self.get_status(issue["status"])['name'])
-                , status_color
-            )
+            fields["status"] = colorfunc(status_string, status_color)
             fields["reporter"] = issue.setdefault("reporter","")
             fields["assignee"] = issue.setdefault("assignee","")
             fields["summary"] = issue.setdefault("summary","")
@@ -108,13 +397,13 @@ class JiraBridge(object):
             if not issue.get("priority", ""):
                 fields["priority"] = ""
             else:
-                fields["priority"] = JiraBridge.object_from_key(issue["priority"], self.get_priorities)["name"]
-            fields["type"] = JiraBridge.object_from_key(
+                fields["priority"] = self.object_from_key(issue["priority"], self.get_priorities)["name"]
+            fields["type"] = self.object_from_key(
                 issue["type"],
                 self.get_issue_types if 'parent' not in issue else self.get_subtask_issue_types
-            ).get("name",  self.get_issue_type(issue["type"]))
+            ).get("name") or self.get_issue_type(issue["type"]).get("name")
             fields["comments"] = "\n"
-            comments = self.get_issue_comments(issue["key"])
+            comments = issue['comments'] if 'comments' in issue else self.get_issue_comments(issue["key"])
             for comment in comments:
                 comment_str =  comment["body"].strip()
                 fields["comments"] += "%s %s : %s\n" % ( colorfunc(comment["created"], "blue"), colorfunc(comment["author"], "green"), comment_str )
@@ -123,8 +412,9 @@ class JiraBridge(object):
             description = (issue.setdefault("description", "") or "").split("\n")
             fields["description"] = "\n".join([description[0]] + [" "*23 + k for k in description[1:]])
 
-            for child in self.search_issues_jql("parent=%s" % issue["key"]):
-                child_type = JiraBridge.object_from_key(child["type"], self.get_subtask_issue_types)["name"].lower()
+            children = issue['children'] if 'children' in issue else self.search_issues_jql("parent=%s" % issue["key"])
+            for child in children:
+                child_type = self.object_from_key(child["type"], self.get_subtask_issue_types)["name"].lower()
                 key = ("%s" % child_type).ljust(20)
                 value = "%s (%s) %s" % (
                     child["key"], child["summary"], colorfunc("%s/browse/%s" % (self.base_url, child["key"]), "white", attrs=['underline'])
@@ -150,13 +440,65 @@ class JiraBridge(object):
             formatted += fields["comments"]
         return formatted
 
-    @staticmethod
-    def object_from_key(value, callable, key='id'):
+    def format_field(self, issue, field):
+        """
+        returns the text for the ``%field`` token of a
+        ``--format`` template.
+        """
+        if field in SPECIAL_FIELDS:
+            value = issue.setdefault('status', '1') if field == 'status' else issue.get(field)
+            data = {}
+            for getter in SPECIAL_FIELDS[field]:
+                data = data or self.object_from_key(value, getattr(self, getter))
+            name = data.get("name")
+            if not name and value and field in SPECIAL_FIELD_FALLBACK:
+                name = (getattr(self, SPECIAL_FIELD_FALLBACK[field])(value) or {}).get("name")
+            return name or ""
+        elif field in LIST_FIELDS:
+            return ", ".join(v.name for v in issue.get('fixVersions', []))
+        value = issue_value(issue, field)
+        return "" if value is None else str(value)
+
+    def record_value(self, issue, field):
+        """
+        returns the value of ``field`` of ``issue`` for the machine
+        readable outputs of view. Fields are read like :meth:`format_field`
+        does (i.e. statuses, priorities and types by name) but the other
+        values are left as they are.
+        """
+        if field in SPECIAL_FIELDS:
+            value = issue.get(field)
+            return (self.format_field(issue, field) or value) if value else None
+        elif field in LIST_FIELDS:
+            return issue.get('fixVersions')
+        return issue_value(issue, field)
+
+    def object_from_key(self, value, callable, key='id'):
+        """
+        looks up the object returned by ``callable`` (one of the
+        metadata getters) whose ``key`` matches ``value``.
+        """
+        index = self.get_index(callable, key)
+        if key == 'name':
+            value = value.lower()
+        return index.get(value, {})
+
+    def get_index(self, callable, key='id'):
+        """
+        returns a ``key`` -> object mapping for the metadata returned by
+        ``callable``. The mapping is only rebuilt when the data returned by
+        ``callable`` changes (i.e. when its cache entry is refreshed).
+        """
         mapping = callable()
-        for k, v in mapping.items():
-            if v[key] == value:
-                return v
-        return {}
+        index_key = (callable, key)
+        source, index = self.indexes.get(index_key, (None, None))
+        if source is not mapping:
+            index = {}
+            for v in mapping.values():
+                if key in v:
+                    index[v[key].lower() if key == 'name' else v[key]] = v
+            self.indexes[index_key] = (mapping, index)
+        return index
 
     @abc.abstractmethod
     def login(self, username, password):
@@ -211,7 +553,7 @@ class JiraBridge(object):
         raise NotImplementedError
 
     @abc.abstractmethod
-    def get_issue(self, issue_id):
+    def get_issue(self, issue_id, fields=None):
         raise NotImplementedError
 
     @abc.abstractmethod
@@ -219,15 +561,15 @@ class JiraBridge(object):
         raise NotImplementedError
 
     @abc.abstractmethod
-    def search_issues(self, free_text, project=None, limit=100):
+    def search_issues(self, free_text, project=None, limit=100, fields=None):
         raise NotImplementedError
 
     @abc.abstractmethod
-    def search_issues_jql(self, query, limit=100, project=None):
+    def search_issues_jql(self, query, limit=100, project=None, fields=None):
         raise NotImplementedError
 
     @abc.abstractmethod
-    def get_issues_by_filter(self, *filters):
+    def get_issues_by_filter(self, *filters, **kwargs):
         raise NotImplementedError
 
     @abc.abstractmethod
@@ -268,14 +610,51 @@ class JiraBridge(object):
     def remove_versions(self, issue, versions, type):
         raise NotImplementedError
 
-from .rest import JiraRestBridge
-from .soap import JiraSoapBridge
 
 def get_bridge(protocol):
     """
     simple factory to get the jira bridge based on the protocol
     """
-    return {
-        'soap': JiraSoapBridge,
-        'rest': JiraRestBridge
-    }[protocol]
+    if sys.version_info < BRIDGE_PYTHON.get(protocol, ()):
+        raise UsageError("the %s protocol requires python %s or later" % (
+            protocol, ".".join(str(k) for k in BRIDGE_PYTHON[protocol])
+        ))
+    module, name = BRIDGES[protocol]
+    return getattr(importlib.import_module(module), name)
+
+
+class BridgeModule(types.ModuleType):
+    """
+    stands in for this module in sys.modules to keep
+    ``from jiracli.bridge import JiraRestBridge`` (and the other bridges)
+    working, importing the bridge only when it is asked for. The other
+    attributes are read from (and set on) the module itself, so patching
+    them still affects its functions.
+
+    (module ``__getattr__`` would do, but only on python 3.7+)
+    """
+    def __init__(self, module):
+        super(BridgeModule, self).__init__(module.__name__)
+        self.__dict__.clear()
+        self.__dict__['_module'] = module
+
+    def __getattr__(self, name):
+        try:
+            return getattr(self._module, name)
+        except AttributeError:
+            for module, bridge in BRIDGES.values():
+                if bridge == name:
+                    return getattr(importlib.import_module(module), name)
+            raise
+
+    def __setattr__(self, name, value):
+        setattr(self._module, name, value)
+
+    def __delattr__(self, name):
+        delattr(self._module, name)
+
+    def __dir__(self):
+        return sorted(set(dir(self._module)) | set(bridge for _, bridge in BRIDGES.values()))
+
+
+sys.modules[__name__] = BridgeModule(sys.modules[__name__])
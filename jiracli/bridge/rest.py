@@ -1,64 +1,239 @@
 """
 
 """
+from functools import partial
+import threading
 from jira.client import JIRA
-from jira.resources import Resource
 from requests import RequestException
-from jiracli.bridge import JiraBridge
+from requests.utils import dict_from_cookiejar
+from jiracli import cache
+from jiracli.bridge import JiraBridge, KEYS_PER_QUERY, auth_user
 from jiracli.cache import cached
-from jiracli.errors import JIRAError
 from jiracli.errors import (
     JiraCliError, JiraAuthenticationError,
-    JiraInitializationError
+    JiraInitializationError, jira_error
 )
-from jiracli.utils import rest_recursive_dict, map_rest_resource
+from jiracli.utils import rest_recursive_dict, share_connections, chunked, clean_rest_value, \
+    RawResource, json_loads
+
+SEARCH_PAGE_SIZE = 100
+# fields of the cleaned issues -> the fields of the rest api they are
+# read from, where they differ (see field_options).
+REST_FIELDS = {
+    'type': 'issuetype',
+    'comments': 'comment',
+    'fixversions': 'fixVersions',
+    'versions': 'fixVersions',
+    'affectsversions': 'versions',
+    'lastviewed': 'lastViewed',
+}
+
+
+def field_options(fields):
+    """
+    returns the keyword arguments restricting a search (or an issue
+    lookup) to ``fields`` of the cleaned issues, or all of them if None.
+    """
+    if fields is None:
+        return {}
+    # clean_issue always maps the issue type.
+    fields = set(REST_FIELDS.get(field, field) for field in fields) | set(['issuetype'])
+    return {'fields': ",".join(sorted(fields))}
 
 
 class JiraRestBridge(JiraBridge):
+    protocol = 'rest'
 
     def __init__(self, base_url, config, persist=False):
         super(JiraRestBridge, self).__init__(base_url, config, persist)
         self.jira = None
+        self.cookies = None
+        self.resumed = None
+        self.session_lock = threading.Lock()
 
-    @cached('resolutions')
+    @cached('resolutions', cache.CACHE_DURATION_LONG)
     def get_resolutions(self):
         return dict((r.name.lower(), rest_recursive_dict(r.raw)) for r in self.jira.resolutions())
 
-    @cached('filters')
+    @cached('filters', cache.CACHE_DURATION_SHORT)
     def get_filters(self):
         filters = dict((f.name, rest_recursive_dict(f.raw)) for f in self.jira.favourite_filters())
         return filters
 
     def clean_issue(self, issue):
+        return self.clean_raw_issue(issue.raw)
+
+    def clean_raw_issue(self, raw):
+        """
+        builds the cleaned issue straight from the json of an issue,
+        without going through jira.resources (see
+        :func:`jiracli.utils.clean_rest_value`).
+        """
         _issue = {}
-        for k,v in issue.fields.__dict__.items():
-            if isinstance(v, Resource):
-                _issue[k] = map_rest_resource(v)
-            elif v is not None:
-                _issue[k] = v
-        _issue['key'] = issue.key
-        _issue['type'] = map_rest_resource(_issue['issuetype'])
+        for k, v in raw['fields'].items():
+            if v is not None:
+                _issue[k] = clean_rest_value(v)
+        _issue['key'] = raw['key']
+        _issue['type'] = _issue['issuetype']
+        comment = raw['fields'].get('comment') or {}
+        comments = comment.get('comments')
+        if comments is not None and len(comments) >= comment.get('total', 0):
+            _issue['comments'] = [self.clean_comment(RawResource(k)) for k in comments]
         return _issue
 
-    def get_issue(self, issue_id):
+    def clean_comment(self, comment):
+        return dict(author=str(comment.author)
+                    , body=comment.body
+                    , created=comment.created
+        )
+
+    def get_issue(self, issue_id, fields=None):
         try:
-            return self.clean_issue(self.jira.issue(issue_id))
+            return self.clean_issue(self.jira.issue(issue_id, **field_options(fields)))
         except:
             return None
 
-    def search_issues(self, free_text, project=None, limit=100):
+    def get_issues(self, issue_ids, fields=None):
+        """
+        generator that yields the issues ``issue_ids`` (skipping those
+        that aren't found) in the same order, using one ``key in (...)``
+        search per :data:`KEYS_PER_QUERY` ids. The searches run
+        concurrently and each batch is yielded as soon as it (and the
+        ones before it) arrived.
+        """
+        batches = self.fetch_in_order(self.batch_fetcher(fields), chunked(issue_ids, KEYS_PER_QUERY))
+        for batch in batches:
+            for issue in batch:
+                if issue is not None:
+                    yield issue
+
+    def batch_fetcher(self, fields=None):
+        """
+        the function :meth:`get_issues` fetches each batch of ids with
+        (through :meth:`fetch_in_order`).
+        """
+        return partial(self.get_issue_batch, fields=fields)
+
+    def batch_query(self, issue_ids):
+        return "key in (%s)" % ",".join('"%s"' % k for k in issue_ids)
+
+    def get_issue_batch(self, issue_ids, fields=None):
+        """
+        returns the issues ``issue_ids`` (or None for those that aren't
+        found) in the same order.
+        """
+        try:
+            found, _ = self.search_page(
+                self.batch_query(issue_ids), 0, len(issue_ids), fields=fields, validate=False
+            )
+        except jira_error():
+            found = []
+        issues = dict((issue['key'].upper(), issue) for issue in found)
+        # ids that weren't matched as given (e.g. of issues that were
+        # moved to another project) are looked up one at a time.
+        return [
+            self.clean_raw_issue(issues[k.upper()]) if k.upper() in issues
+            else self.get_issue(k, fields=fields)
+            for k in issue_ids
+        ]
+
+    def search_issues(self, free_text, project=None, limit=None, fields=None):
         query = '(summary~"%s" or description~"%s")' % (free_text, free_text)
         if project:
             query += ' and project=%s' % project
         query += ' order by key'
-        return [self.clean_issue(issue) for issue in self.jira.search_issues(query,maxResults=100)]
-
-    def search_issues_jql(self, query, limit=100, project=None):
-        return [self.clean_issue(issue) for issue in self.jira.search_issues(query, maxResults=100)]
+        return self.search_issues_jql(query, limit=limit, fields=fields)
+
+    def search_issues_jql(self, query, limit=None, project=None, fields=None):
+        """
+        generator that pages through the results of ``query`` (using
+        startAt/maxResults) and yields each cleaned issue as its page
+        arrives. ``limit`` caps the total number of issues returned.
+
+        once the first page reports the total number of matches, the
+        remaining pages are prefetched concurrently (at most
+        ``config.search_concurrency`` at a time) and yielded in order.
+        only ``fields`` of the issues are requested when it is given.
+
+        the pages are read by :meth:`search_page` and cleaned by
+        :meth:`clean_raw_issue`, so no jira.resources objects are built.
+        """
+        page_size = self.page_size(0, limit)
+        page, total = self.search_page(query, 0, page_size, fields=fields)
+        for issue in page:
+            yield self.clean_raw_issue(issue)
+        start = len(page)
+        if total is None:
+            while len(page) == page_size and (limit is None or start < limit):
+                page_size = self.page_size(start, limit)
+                page, _ = self.search_page(query, start, page_size, fields=fields)
+                for issue in page:
+                    yield self.clean_raw_issue(issue)
+                start += len(page)
+            return
+        pages = self.page_ranges(start, total, limit, len(page))
+        for page in self.fetch_in_order(self.page_fetcher(query, fields), pages):
+            for issue in page:
+                yield self.clean_raw_issue(issue)
+
+    def page_size(self, start, limit=None):
+        """
+        the size of the page of results at ``start`` (of at most ``limit``).
+        """
+        return SEARCH_PAGE_SIZE if limit is None else min(SEARCH_PAGE_SIZE, limit - start)
+
+    def page_ranges(self, start, total, limit, page_size):
+        """
+        returns the (start, size) of the pages following the first one
+        (of ``page_size`` issues) of a search with ``total`` matches.
+        """
+        end = total if limit is None else min(total, limit)
+        if not page_size:
+            return []
+        # the server may cap maxResults below the requested page size,
+        # so the size of the first page is used for the others.
+        return [(k, min(page_size, end - k)) for k in range(start, end, page_size)]
+
+    def page_fetcher(self, query, fields=None):
+        """
+        the function :meth:`search_issues_jql` fetches the issues on each
+        (start, size) page after the first with (through
+        :meth:`fetch_in_order`).
+        """
+        def fetch(page):
+            return self.search_page(query, page[0], page[1], fields=fields)[0]
+        return fetch
+
+    def search_params(self, query, start, size, fields=None, validate=True):
+        """
+        the parameters of the request to /search for a page of the
+        results of ``query``. All the fields are requested when ``fields``
+        is None (as jira.client does), rather than the navigable ones the
+        server defaults to.
+        """
+        params = {'jql': query, 'startAt': start, 'maxResults': size}
+        params.update(field_options(fields) if fields is not None else {'fields': '*all'})
+        if not validate:
+            params['validateQuery'] = 'false'
+        return params
+
+    def search_page(self, query, start, size, fields=None, validate=True):
+        """
+        returns the json of the issues on one page of the results of
+        ``query`` and the total number of matches. The page is read from
+        /search over the session of the jira client, bypassing
+        jira.client (and its lookup of the field names).
+        """
+        response = self.jira._session.get(
+            self.jira._get_url('search'),
+            params=self.search_params(query, start, size, fields, validate)
+        )
+        result = json_loads(response.content)
+        return result.get('issues', []), result.get('total')
 
-    def get_issues_by_filter(self, *filters):
+    def get_issues_by_filter(self, *filters, **kwargs):
         return self.search_issues_jql(
-            "filter in (%s)" % ",".join(['"%s"' % f for f in filters])
+            "filter in (%s)" % ",".join(['"%s"' % f for f in filters]), fields=kwargs.get('fields')
         )
 
     def add_comment(self, issue, comment):
@@ -66,12 +241,20 @@ class JiraRestBridge(JiraBridge):
 
 
     def transition_issue(self, issue, transition, resolution):
+        transition_id, fields = self.transition_fields(issue, transition, resolution)
+        return self.jira.transition_issue(issue, transition_id, fields=fields)
+
+    def transition_fields(self, issue, transition, resolution):
+        """
+        returns the id of ``transition`` of ``issue`` and the fields to
+        set with it.
+        """
         transitions = self.get_available_transitions(issue)
         fields = {}
         if resolution:
             fields["resolution"] = self.get_resolutions()[resolution.lower()]
         try:
-            return self.jira.transition_issue(issue, transitions[transition]['id'], fields=fields)
+            return transitions[transition]['id'], fields
         except KeyError:
             raise JiraCliError("Invalid transition '%s'. Use one of [%s]" % (transition, ",".join(transitions)))
 
@@ -81,6 +264,24 @@ class JiraRestBridge(JiraBridge):
     def create_issue(self, project, type='bug', summary="", description="",
                      priority="minor", parent=None, assignee="", reporter="",
                      labels=[], components={}, **extras):
+        issue = self.jira.create_issue(self.issue_fields(
+            project, type, summary, description, priority, parent, labels, components, **extras
+        ))
+        if not (assignee or reporter):
+            return self.clean_issue(issue)
+        else:
+            key = issue.key
+            if assignee:
+                issue = self.clean_issue(self.assign_issue(key, assignee))
+            if reporter:
+                issue = self.clean_issue(self.change_reporter(key, reporter))
+            return issue
+
+    def issue_fields(self, project, type='bug', summary="", description="",
+                     priority="minor", parent=None, labels=[], components={}, **extras):
+        """
+        the fields of the issue that :meth:`create_issue` creates.
+        """
         issue = {
             "project": {'key':project.upper()},
             "summary": summary,
@@ -101,31 +302,78 @@ class JiraRestBridge(JiraBridge):
             issue['issuetype'] = {'id':self.get_issue_types()[type.lower()]['id']}
         if extras:
             issue.update(extras)
-        issue = self.jira.create_issue(issue)
-        if not (assignee or reporter):
-            return self.clean_issue(issue)
-        else:
-            key = issue.key
-            if assignee:
-                issue = self.clean_issue(self.assign_issue(key, assignee))
-            if reporter:
-                issue = self.clean_issue(self.change_reporter(key, reporter))
-            return issue
+        return issue
 
     def login(self, **auth_kwargs):
+        self.user = auth_user(auth_kwargs) or self.user
         try:
             self.jira = JIRA(options={'server': self.base_url, 'check_update': False},
                          get_server_info=False, validate=False, **auth_kwargs
             )
-        except JIRAError:
+            share_connections(self.jira._session)
+            self.jira._session.hooks['response'].append(self.store_session)
+        except jira_error():
             raise JiraAuthenticationError('failure to authenticate')
         except RequestException:
             raise JiraInitializationError('failure to communicate with jira')
 
+    def resume(self):
+        session = self.load_session()
+        if not session:
+            return False
+        self.jira = JIRA(options={'server': self.base_url, 'check_update': False},
+                         get_server_info=False, validate=False
+        )
+        share_connections(self.jira._session)
+        self.jira._session.cookies.update(session['cookies'])
+        self.jira._session.hooks['response'].append(self.check_session)
+        self.resumed = self.jira
+        return True
+
+    def store_session(self, response, *args, **kwargs):
+        """
+        response hook that persists the session cookies handed out
+        by jira to authenticated requests.
+        """
+        if (
+            response.status_code >= 400 or not response.cookies
+            or response.headers.get('X-AUSERNAME') == 'anonymous'
+        ):
+            return
+        cookies = dict_from_cookiejar(self.jira._session.cookies)
+        cookies.update(dict_from_cookiejar(response.cookies))
+        if cookies != self.cookies:
+            self.cookies = cookies
+            self.save_session(cookies=cookies)
+
+    def check_session(self, response, *args, **kwargs):
+        """
+        response hook for resumed sessions that logs in again (once)
+        and retries the request when the session cookies have expired.
+        jira serves expired sessions anonymously, so that is treated
+        the same as a 401.
+        """
+        if not self.reauthenticate or not (
+            response.status_code == 401
+            or response.headers.get('X-AUSERNAME') == 'anonymous'
+        ):
+            return response
+        with self.session_lock:
+            if self.jira is self.resumed:
+                self.clear_session()
+                self.jira = self.reauthenticate().jira
+        session = self.jira._session
+        request = response.request.copy()
+        request.headers.pop('Cookie', None)
+        request.prepare_cookies(session.cookies)
+        request.prepare_auth(session.auth, request.url)
+        request.hooks = {'response': list(session.hooks['response'])}
+        return session.send(request, **kwargs)
+
     def get_available_transitions(self, issue):
         return dict((t['name'].lower(), t) for t in self.jira.transitions(issue))
 
-    @cached('issue_types')
+    @cached('issue_types', cache.CACHE_DURATION_LONG)
     def get_issue_types(self):
         types = dict((k.name.lower(), k.raw) for k in self.jira.issue_types() if not k.subtask)
         for k in types:
@@ -133,11 +381,11 @@ class JiraRestBridge(JiraBridge):
                 types['id'] = types['id'][0]
         return types
 
-    @cached("issue_type")
+    @cached("issue_type", cache.CACHE_DURATION_LONG)
     def get_issue_type(self, issue_type_id):
         return self.jira.issue_type(issue_type_id).raw
 
-    @cached('subtask_types')
+    @cached('subtask_types', cache.CACHE_DURATION_LONG)
     def get_subtask_issue_types(self):
         types = dict((k.name.lower(), k.raw) for k in self.jira.issue_types() if k.subtask)
         for k in types:
@@ -169,35 +417,30 @@ class JiraRestBridge(JiraBridge):
     def get_projects(self):
         return dict((k.name.lower(), k.raw) for k in self.jira.projects())
 
-    @cached('priorities')
+    @cached('priorities', cache.CACHE_DURATION_LONG)
     def get_priorities(self):
         return dict((k.name.lower(), dict(k.raw)) for k in self.jira.priorities())
 
-    @cached('components')
+    @cached('components', cache.CACHE_DURATION_SHORT)
     def get_components(self, project):
         return [k.raw for k in self.jira.project_components(project)]
 
+    @cached('versions', cache.CACHE_DURATION_SHORT)
     def list_versions(self, project):
         versions = self.jira.project(project).versions
-        versions.sort(cmp=lambda l, r: cmp(l.id, l.id))
+        versions.sort(key=lambda version: int(version.id))
         return [k.raw for k in versions]
 
-    @cached('statuses')
+    @cached('statuses', cache.CACHE_DURATION_LONG)
     def get_statuses(self):
         return dict((k.name.lower(), dict(k.raw)) for k in self.jira.statuses())
 
-    @cached('status')
+    @cached('status', cache.CACHE_DURATION_LONG)
     def get_status(self, status_id):
         return self.jira.status(status_id).raw
 
     def get_issue_comments(self, issue):
-        return [
-            dict(author=str(comment.author)
-                 , body=comment.body
-                 , created=comment.created
-            )
-            for comment in self.jira.comments(issue)
-        ]
+        return [self.clean_comment(comment) for comment in self.jira.comments(issue)]
 
     def add_versions(self, issue, versions, type):
         args = {}
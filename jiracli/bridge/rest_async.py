@@ -0,0 +1,391 @@
+"""
+
+"""
+import asyncio
+import atexit
+import base64
+from collections import deque
+from itertools import islice
+import threading
+from jiracli import cache
+from jiracli.bridge import auth_user
+from jiracli.bridge.rest import JiraRestBridge, field_options
+from jiracli.cache import cached
+from jiracli.errors import UsageError, jira_error
+from jiracli.utils import RawResource, json_loads
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover
+    raise UsageError("the rest-async protocol requires aiohttp (pip install aiohttp)")
+
+
+def error_text(body):
+    """
+    the message of an error response of the rest api (as jira.client
+    reports it).
+    """
+    try:
+        result = json_loads(body)
+    except ValueError:
+        return body.decode('utf-8', 'replace')
+    if not isinstance(result, dict):
+        return body.decode('utf-8', 'replace')
+    messages = list(result.get('errorMessages') or [])
+    messages.extend((result.get('errors') or {}).values())
+    return "\n".join(messages) or body.decode('utf-8', 'replace')
+
+
+class JiraAsyncRestBridge(JiraRestBridge):
+    """
+    rest bridge that talks to jira with aiohttp on an event loop of its
+    own (running in a background thread), so that the pages, batches and
+    comments the commands ask for are requested concurrently without a
+    thread per request. At most :attr:`concurrency` requests are in
+    flight at any time, however many of them are scheduled.
+
+    the cleaning of the issues and the commands built on the other
+    methods are shared with :class:`JiraRestBridge`.
+    """
+    protocol = 'rest-async'
+
+    def __init__(self, base_url, config, persist=False):
+        super(JiraAsyncRestBridge, self).__init__(base_url, config, persist)
+        self.auth = None
+        self.loop = None
+        self.thread = None
+        self.client = None
+        self.in_flight = None
+        self.session_changed = None
+        self.loop_lock = threading.Lock()
+
+    def start(self):
+        """
+        starts the event loop thread (once) and returns the loop.
+        """
+        with self.loop_lock:
+            if self.loop is None:
+                loop = asyncio.new_event_loop()
+                self.thread = threading.Thread(target=loop.run_forever)
+                self.thread.daemon = True
+                self.thread.start()
+                self.loop = loop
+                atexit.register(self.close)
+        return self.loop
+
+    def run(self, coroutine):
+        """
+        runs ``coroutine`` on the event loop and returns its result.
+        """
+        return self.submit(coroutine).result()
+
+    def submit(self, coroutine):
+        """
+        schedules ``coroutine`` on the event loop and returns a
+        concurrent.futures.Future of its result.
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self.start())
+
+    def close(self):
+        """
+        closes the http session and stops the event loop.
+        """
+        with self.loop_lock:
+            loop, self.loop = self.loop, None
+        if loop is None:
+            return
+        if self.client is not None:
+            asyncio.run_coroutine_threadsafe(self.client.close(), loop).result()
+            self.client = None
+        loop.call_soon_threadsafe(loop.stop)
+        self.thread.join()
+        loop.close()
+
+    def session(self):
+        """
+        the aiohttp session of the bridge, created in the event loop (with
+        the cookies of a resumed login) along with the semaphore bounding
+        the requests in flight.
+        """
+        if self.client is None:
+            jar = aiohttp.CookieJar(unsafe=True)
+            if self.resumed and self.cookies:
+                jar.update_cookies(self.cookies)
+            self.client = aiohttp.ClientSession(cookie_jar=jar)
+            self.in_flight = asyncio.Semaphore(self.concurrency)
+            self.session_changed = asyncio.Lock()
+        return self.client
+
+    def url(self, path):
+        return "%s/rest/api/2/%s" % (self.base_url.rstrip('/'), path)
+
+    async def request(self, method, path, params=None, data=None, retry=True):
+        """
+        sends a request to the rest api and returns the json it responded
+        with (or None if there was no body). Raises a JIRAError when
+        the response is an error, like jira.client does.
+
+        a resumed session that turns out to have expired (jira serves
+        those anonymously) logs in again once and repeats the request.
+        """
+        client = self.session()
+        if params:
+            params = dict((k, str(v)) for k, v in params.items())
+        async with self.in_flight:
+            async with client.request(
+                method, self.url(path), params=params, json=data, headers=self.auth
+            ) as response:
+                body = await response.read()
+                status = response.status
+                anonymous = response.headers.get('X-AUSERNAME') == 'anonymous'
+        if self.resumed and (status == 401 or anonymous):
+            if retry and self.reauthenticate:
+                await self.renew_session()
+                return await self.request(method, path, params, data, retry=False)
+        elif status < 400 and not anonymous and self.auth is not None:
+            self.store_cookies()
+        if status >= 400:
+            raise jira_error()(text=error_text(body), status_code=status, url=self.url(path))
+        return json_loads(body) if body else None
+
+    async def renew_session(self):
+        """
+        replaces the expired session with a fresh login (once, however
+        many requests found out about it).
+        """
+        async with self.session_changed:
+            if not self.resumed:
+                return
+            self.clear_session()
+            bridge = await asyncio.get_event_loop().run_in_executor(None, self.reauthenticate)
+            self.auth, self.user, self.resumed = bridge.auth, bridge.user, None
+            self.client.cookie_jar.clear()
+
+    def store_cookies(self):
+        """
+        persists the session cookies handed out by jira to authenticated
+        requests.
+        """
+        cookies = dict((cookie.key, cookie.value) for cookie in self.client.cookie_jar)
+        if cookies and cookies != self.cookies:
+            self.cookies = cookies
+            self.save_session(cookies=cookies)
+
+    async def gather(self, coroutines):
+        return await asyncio.gather(*coroutines)
+
+    def fetch_in_order(self, fetch, arguments):
+        """
+        like :meth:`JiraBridge.fetch_in_order` but for a coroutine
+        function ``fetch``, whose calls are scheduled on the event loop
+        instead of a thread pool.
+        """
+        if not asyncio.iscoroutinefunction(fetch):
+            for result in super(JiraAsyncRestBridge, self).fetch_in_order(fetch, arguments):
+                yield result
+            return
+        arguments = iter(arguments)
+        pending = deque(self.submit(fetch(argument)) for argument in islice(arguments, self.concurrency))
+        try:
+            while pending:
+                result = pending.popleft().result()
+                for argument in islice(arguments, 1):
+                    pending.append(self.submit(fetch(argument)))
+                yield result
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def login(self, **auth_kwargs):
+        credentials = auth_kwargs.get('basic_auth') or auth_kwargs.get('auth')
+        if not credentials:
+            raise UsageError("the rest-async protocol only supports basic authentication")
+        self.user = auth_user(auth_kwargs) or self.user
+        self.auth = {'Authorization': 'Basic ' + base64.b64encode(
+            ('%s:%s' % tuple(credentials)).encode('utf-8')
+        ).decode('ascii')}
+        self.resumed = None
+
+    def resume(self):
+        session = self.load_session()
+        if not session:
+            return False
+        self.cookies = session['cookies']
+        self.resumed = True
+        return True
+
+    async def fetch_json(self, path, params=None):
+        return await self.request('GET', path, params)
+
+    def get_json(self, path, params=None):
+        return self.run(self.fetch_json(path, params))
+
+    @cached('resolutions', cache.CACHE_DURATION_LONG)
+    def get_resolutions(self):
+        return dict((r['name'].lower(), r) for r in self.get_json('resolution'))
+
+    @cached('filters', cache.CACHE_DURATION_SHORT)
+    def get_filters(self):
+        return dict((f['name'], f) for f in self.get_json('filter/favourite'))
+
+    async def fetch_issue(self, issue_id, fields=None):
+        try:
+            return self.clean_raw_issue(
+                await self.fetch_json('issue/%s' % issue_id, field_options(fields))
+            )
+        except jira_error():
+            return None
+
+    def get_issue(self, issue_id, fields=None):
+        return self.run(self.fetch_issue(issue_id, fields))
+
+    def batch_fetcher(self, fields=None):
+        async def fetch(issue_ids):
+            return await self.fetch_issue_batch(issue_ids, fields)
+        return fetch
+
+    async def fetch_issue_batch(self, issue_ids, fields=None):
+        try:
+            found, _ = await self.fetch_page(
+                self.batch_query(issue_ids), 0, len(issue_ids), fields=fields, validate=False
+            )
+        except jira_error():
+            found = []
+        issues = dict((issue['key'].upper(), self.clean_raw_issue(issue)) for issue in found)
+        # ids that weren't matched as given are looked up individually
+        # (and concurrently).
+        missing = [k for k in issue_ids if k.upper() not in issues]
+        looked_up = await self.gather(self.fetch_issue(k, fields) for k in missing)
+        issues.update(zip([k.upper() for k in missing], looked_up))
+        return [issues[k.upper()] for k in issue_ids]
+
+    def get_issue_batch(self, issue_ids, fields=None):
+        return self.run(self.fetch_issue_batch(issue_ids, fields))
+
+    def page_fetcher(self, query, fields=None):
+        async def fetch(page):
+            return (await self.fetch_page(query, page[0], page[1], fields=fields))[0]
+        return fetch
+
+    async def fetch_page(self, query, start, size, fields=None, validate=True):
+        result = await self.fetch_json(
+            'search', self.search_params(query, start, size, fields, validate)
+        )
+        return result.get('issues', []), result.get('total')
+
+    def search_page(self, query, start, size, fields=None, validate=True):
+        return self.run(self.fetch_page(query, start, size, fields, validate))
+
+    def add_comments(self, issues):
+        """
+        attaches the comments of the issues in ``issues`` that don't
+        already carry them, requesting them all at once.
+        """
+        missing = [issue for issue in issues if 'comments' not in issue]
+        if missing:
+            comments = self.run(self.gather(
+                self.fetch_issue_comments(issue['key']) for issue in missing
+            ))
+            for issue, issue_comments in zip(missing, comments):
+                issue['comments'] = issue_comments
+        return issues
+
+    async def fetch_issue_comments(self, issue):
+        result = await self.fetch_json('issue/%s/comment' % issue)
+        return [self.clean_comment(RawResource(comment)) for comment in result['comments']]
+
+    def get_issue_comments(self, issue):
+        return self.run(self.fetch_issue_comments(issue))
+
+    def add_comment(self, issue, comment):
+        self.run(self.request('POST', 'issue/%s/comment' % issue, data={'body': comment}))
+
+    def transition_issue(self, issue, transition, resolution):
+        transition_id, fields = self.transition_fields(issue, transition, resolution)
+        return self.run(self.request(
+            'POST', 'issue/%s/transitions' % issue,
+            data={'transition': {'id': transition_id}, 'fields': fields}
+        ))
+
+    def create_issue(self, project, type='bug', summary="", description="",
+                     priority="minor", parent=None, assignee="", reporter="",
+                     labels=[], components={}, **extras):
+        issue = self.issue_fields(
+            project, type, summary, description, priority, parent, labels, components, **extras
+        )
+        key = self.run(self.request('POST', 'issue', data={'fields': issue}))['key']
+        if assignee:
+            self.assign_issue(key, assignee)
+        if reporter:
+            self.change_reporter(key, reporter)
+        return self.get_issue(key)
+
+    def get_available_transitions(self, issue):
+        return dict(
+            (t['name'].lower(), t) for t in self.get_json('issue/%s/transitions' % issue)['transitions']
+        )
+
+    @cached('issue_types', cache.CACHE_DURATION_LONG)
+    def get_issue_types(self):
+        return dict((k['name'].lower(), k) for k in self.get_json('issuetype') if not k['subtask'])
+
+    @cached("issue_type", cache.CACHE_DURATION_LONG)
+    def get_issue_type(self, issue_type_id):
+        return self.get_json('issuetype/%s' % issue_type_id)
+
+    @cached('subtask_types', cache.CACHE_DURATION_LONG)
+    def get_subtask_issue_types(self):
+        return dict((k['name'].lower(), k) for k in self.get_json('issuetype') if k['subtask'])
+
+    def update_issue(self, issue_id, update={}, **kwargs):
+        """
+        updates ``issue_id`` with the operations in ``update`` and the
+        fields in ``kwargs`` (with the heuristics of jira's Issue.update:
+        lists are operations and user names are wrapped) and returns
+        the updated issue.
+        """
+        fields, update = {}, dict(update)
+        for field, value in kwargs.items():
+            if isinstance(value, list):
+                update.setdefault(field, []).extend(value)
+            elif field in ('assignee', 'reporter') and isinstance(value, str):
+                fields[field] = {'name': value}
+            else:
+                fields[field] = value
+        self.run(self.request(
+            'PUT', 'issue/%s' % issue_id, data={'fields': fields, 'update': update}
+        ))
+        return self.get_issue(issue_id)
+
+    def add_labels(self, issue_id, labels, merge=False):
+        current = self.get_issue(issue_id, fields=['labels']) or {}
+        return self.run(self.request(
+            'PUT', 'issue/%s' % issue_id,
+            data={'fields': {'labels': current.get('labels', []) + list(labels)}}
+        ))
+
+    @cached('projects')
+    def get_projects(self):
+        return dict((k['name'].lower(), k) for k in self.get_json('project'))
+
+    @cached('priorities', cache.CACHE_DURATION_LONG)
+    def get_priorities(self):
+        return dict((k['name'].lower(), k) for k in self.get_json('priority'))
+
+    @cached('components', cache.CACHE_DURATION_SHORT)
+    def get_components(self, project):
+        return self.get_json('project/%s/components' % project)
+
+    @cached('versions', cache.CACHE_DURATION_SHORT)
+    def list_versions(self, project):
+        versions = self.get_json('project/%s/versions' % project)
+        versions.sort(key=lambda version: int(version['id']))
+        return versions
+
+    @cached('statuses', cache.CACHE_DURATION_LONG)
+    def get_statuses(self):
+        return dict((k['name'].lower(), k) for k in self.get_json('status'))
+
+    @cached('status', cache.CACHE_DURATION_LONG)
+    def get_status(self, status_id):
+        return self.get_json('status/%s' % status_id)
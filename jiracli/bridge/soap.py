@@ -1,23 +1,112 @@
 """
 
 """
+import io
+import os
+import pickle
 import socket
+import threading
 from suds import WebFault
+from suds.cache import ObjectCache
 from suds.client import Client
-from jiracli.bridge import JiraBridge
+from suds.transport import Transport, TransportError, Reply
+from jiracli import cache
+from jiracli.bridge import JiraBridge, auth_user
 from jiracli.cache import cached
 from jiracli.errors import JiraCliError, JiraInitializationError, \
     JiraAuthenticationError, UsageError
-from jiracli.utils import soap_recursive_dict
-from six.moves.urllib import request
+from jiracli.utils import soap_recursive_dict, get_session
+
+
+class RequestsTransport(Transport):
+    """
+    suds transport that sends its requests through the
+    shared (pooled) :class:`requests.Session`.
+    """
+    def __init__(self, session):
+        Transport.__init__(self)
+        self.session = session
+
+    def open(self, request):
+        resp = self.session.get(request.url, headers=request.headers, timeout=self.options.timeout)
+        if resp.status_code >= 300:
+            raise TransportError(resp.reason, resp.status_code, io.BytesIO(resp.content))
+        return io.BytesIO(resp.content)
+
+    def send(self, request):
+        resp = self.session.post(
+            request.url, data=request.message, headers=request.headers, timeout=self.options.timeout
+        )
+        if resp.status_code >= 300:
+            raise TransportError(resp.reason, resp.status_code, io.BytesIO(resp.content))
+        return Reply(resp.status_code, resp.headers, resp.content)
+
+
+class AtomicObjectCache(ObjectCache):
+    """
+    suds object cache that renames its entries into place once they
+    are written, so that concurrent processes never read a partially
+    written service definition.
+    """
+    def put(self, id, object):
+        if not os.path.isdir(self.location):
+            os.makedirs(self.location)
+        path = os.path.join(self.location, "%s-%s.%s" % (self.fnprefix, id, self.fnsuffix()))
+        try:
+            cache.atomic_write(path, pickle.dumps(object, self.protocol))
+        except (IOError, OSError):
+            pass
+        return object
+
+
+class AuthenticatedService(object):
+    """
+    wraps the suds service of a resumed session so that calls failing
+    because its token expired are retried once after logging in again.
+    """
+    def __init__(self, bridge, service):
+        self.bridge = bridge
+        self.service = service
+        self.lock = threading.Lock()
+
+    def __getattr__(self, name):
+        method = getattr(self.service, name)
+
+        def call(token, *args):
+            try:
+                return method(token, *args)
+            except WebFault as e:
+                if (
+                    not self.bridge.reauthenticate or
+                    'RemoteAuthenticationException' not in str(e.fault.faultstring)
+                ):
+                    raise
+            with self.lock:
+                if self.bridge.service is self:
+                    self.bridge.clear_session()
+                    self.bridge.config.token = ""
+                    self.bridge.config.save()
+                    self.bridge.token = self.bridge.reauthenticate().token
+                    self.bridge.service = self.service
+            return method(self.bridge.token, *args)
+        return call
+
 
 class JiraSoapBridge(JiraBridge):
+    protocol = 'soap'
 
 
     def get_children(self, issue_id):
         return [soap_recursive_dict(item) for item in self.service.getSubTasks(self.token, issue_id)]
 
-    @cached("subtasks_issue_types")
+    def add_children(self, issues):
+        # remote issues don't reference their parent, so the results of a
+        # combined 'parent in (...)' search can't be grouped per issue.
+        for issue in issues:
+            issue['children'] = self.search_issues_jql("parent=%s" % issue['key'])
+        return issues
+
+    @cached("subtasks_issue_types", cache.CACHE_DURATION_LONG)
     def get_subtask_issue_types(self):
         issue_types = self.service.getSubTaskIssueTypes(self.token)
         issue_types = [soap_recursive_dict(k) for k in issue_types]
@@ -25,23 +114,30 @@ class JiraSoapBridge(JiraBridge):
 
 
     def ping(self):
-        if type(self.service) == type(None):
+        if type(self.service) == type(None) or not self.token:
             return False
         try:
             self.service.getIssueTypes(self.token)
             return True
-        except WebFault:
-            self.token = self.config.token = None
+        except (WebFault, TransportError, IOError):
+            self.token = self.config.token = ""
             self.config.save()
             return False
 
     def __init__(self, base_url, config, persist=True):
         super(JiraSoapBridge, self).__init__(base_url, config, persist)
         try:
-            request.urlopen('%s/rpc/soap/jirasoapservice-v2?wsdl' % self.base_url)
-            jiraobj = Client('%s/rpc/soap/jirasoapservice-v2?wsdl' % self.base_url)
+            # the parsed service definition is cached on disk (and only
+            # refetched once it expires) so that startup doesn't need
+            # to download and parse the wsdl.
+            jiraobj = Client(
+                '%s/rpc/soap/jirasoapservice-v2?wsdl' % self.base_url,
+                transport=RequestsTransport(get_session()),
+                cache=AtomicObjectCache(os.path.join(cache.CACHE_DIR, 'wsdl'), seconds=cache.CACHE_DURATION),
+                cachingpolicy=1
+            )
             self.service = jiraobj.service
-        except (socket.gaierror, IOError, ValueError):
+        except (socket.gaierror, IOError, ValueError, TransportError):
             self.service = None
         self.token = config.token
 
@@ -120,18 +216,18 @@ class JiraSoapBridge(JiraBridge):
             raise JiraCliError("updating labels via the soap protocol is not supported")
         return self.update_issue(issue_id, labels=labels)
 
-    @cached('filters')
+    @cached('filters', cache.CACHE_DURATION_SHORT)
     def get_filters(self):
         filters = self.service.getSavedFilters(self.token)
         filters += self.service.getFavouriteFilters(self.token)
         return dict((item["name"].lower(), soap_recursive_dict(item)) for item in filters)
 
-    @cached('priorities')
+    @cached('priorities', cache.CACHE_DURATION_LONG)
     def get_priorities(self):
         priorities = [soap_recursive_dict(k) for k in self.service.getPriorities(self.token)]
         return dict((item["name"].lower(), item) for item in priorities)
 
-    @cached('issue_types')
+    @cached('issue_types', cache.CACHE_DURATION_LONG)
     def get_issue_types(self):
         issue_types = self.service.getIssueTypes(self.token)
         issue_types = [soap_recursive_dict(k) for k in issue_types]
@@ -141,48 +237,72 @@ class JiraSoapBridge(JiraBridge):
     def get_projects(self):
         return [soap_recursive_dict(k) for k in self.service.getProjectsNoSchemes(self.token)]
 
+    @cached('components', cache.CACHE_DURATION_SHORT)
     def get_components(self, project):
         return [soap_recursive_dict(k) for k in self.service.getComponents(self.token, project)]
 
+    @cached('versions', cache.CACHE_DURATION_SHORT)
     def list_versions(self, project):
         return [soap_recursive_dict(k) for k in self.service.getVersions(self.token, project)]
 
     def login(self, **auth_kwargs):
         if type(self.service) == type(None):
             raise JiraInitializationError()
+        self.user = auth_user(auth_kwargs) or self.user
         try:
             if not (self.token and self.ping()):
                 username, password = auth_kwargs['auth']
                 self.token = self.config.token = self.service.login(username, password)
+            self.save_session(token=self.token)
         except (WebFault, AttributeError):
             self.token = None
             raise JiraAuthenticationError()
+        except (TransportError, IOError):
+            self.token = None
+            raise JiraInitializationError()
         finally:
             if self.persist:
                 self.config.token = self.token
                 self.config.save()
 
-    @cached('status')
+    def resume(self):
+        session = self.load_session()
+        if not (self.service and self.token and session and session['token'] == self.token):
+            return False
+        self.service = AuthenticatedService(self, self.service)
+        return True
+
+    @cached('status', cache.CACHE_DURATION_LONG)
     def get_statuses(self):
         statuses = [soap_recursive_dict(k) for k in self.service.getStatuses(self.token)]
         return dict((item['name'].lower(), item) for item in statuses)
 
-    def search_issues_jql(self, query, limit=100):
+    def get_status(self, status_id):
+        return self.object_from_key(status_id, self.get_statuses)
+
+    def get_issue_type(self, issue_type_id):
+        return (
+            self.object_from_key(issue_type_id, self.get_issue_types) or
+            self.object_from_key(issue_type_id, self.get_subtask_issue_types)
+        )
+
+    # the soap api always returns complete issues, so ``fields`` is ignored.
+    def search_issues_jql(self, query, limit=100, fields=None):
         return [soap_recursive_dict(k) for k in self.service.getIssuesFromJqlSearch(self.token, query, limit)]
 
-    def search_issues(self, free_text, project=None, limit = 100):
+    def search_issues(self, free_text, project=None, limit = 100, fields=None):
         if not project:
             return [soap_recursive_dict(k) for k in self.service.getIssuesFromTextSearch(self.token, free_text)]
         else:
             return [soap_recursive_dict(k) for k in self.service.getIssuesFromTextSearchWithProject(self.token, [project], free_text, limit)]
 
-    def get_issue(self, issue_id):
+    def get_issue(self, issue_id, fields=None):
         try:
             return soap_recursive_dict(self.service.getIssue( self.token, issue_id))
         except WebFault:
             return None
 
-    def get_issues_by_filter(self, *filters):
+    def get_issues_by_filter(self, *filters, **kwargs):
         issues = []
         for filter in filters:
             try:
@@ -192,7 +312,7 @@ class JiraSoapBridge(JiraBridge):
                 raise UsageError("filter %s not found" % filter)
         return [soap_recursive_dict(k) for k in issues]
 
-    @cached('resolutions')
+    @cached('resolutions', cache.CACHE_DURATION_LONG)
     def get_resolutions(self):
         resolutions = [soap_recursive_dict(k) for k in self.service.getResolutions(self.token)]
         return dict((item['name'], item) for item in resolutions)
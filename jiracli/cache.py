@@ -1,71 +1,556 @@
 """
 
 """
-from contextlib import closing
+from collections import defaultdict
+from contextlib import contextmanager
 from functools import wraps
+import atexit
+import glob
 import hashlib
+import json
 import os
 import pickle
 import shutil
+import sqlite3
+import tempfile
+import threading
 import time
 from jiracli.utils import CONFIG_DIR
+try:
+    import fcntl
+except ImportError:  # pragma: no cover (windows)
+    fcntl = None
 
 CACHE_DIR = os.path.join(CONFIG_DIR, 'cache')
 CACHE_DURATION = 60*60*24
+# durations for data that rarely (statuses, issue types) and
+# frequently (filters, components) changes.
+CACHE_DURATION_LONG = 60*60*24*7
+CACHE_DURATION_SHORT = 60*60
+# seconds for which the entries of each namespace stay fresh, as
+# declared through cached() and as overridden through configure().
+DURATIONS = {}
+DURATION_OVERRIDES = {}
+# all entries live in a single sqlite database in CACHE_DIR.
+CACHE_FILE = 'cache.db'
+# upper bound (in bytes) of the pickled entries. The oldest entries
+# are evicted once it is exceeded.
+CACHE_SIZE = 1024*1024*32
+# entries are locked through byte ranges of this file, one of
+# LOCK_SLOTS per entry (entries hashing to the same slot share it).
+LOCK_FILE = 'cache.lock'
+LOCK_SLOTS = 2**16
+# open connections to the database (and descriptors of the lock
+# file), keyed by process and path.
+CONNECTIONS = {}
+LOCK_FDS = {}
+LOCK = threading.RLock()
+# record locks don't exclude threads of the same process, so each
+# slot is also guarded by a thread lock.
+SLOT_LOCKS = defaultdict(threading.Lock)
+SCHEMA_VERSION = 5
+# hits, misses and refreshes of the cached() getters of each
+# namespace, keyed by database path. They are added to the stats
+# table of the database when the process exits.
+COUNTERS = defaultdict(lambda: defaultdict(lambda: [0, 0, 0]))
+HIT, MISS, REFRESH = range(3)
+# the refresh (if any) in progress in each thread.
+REVALIDATION = threading.local()
+
+
+class NotModified(Exception):
+    """
+    raised (by :class:`jiracli.adapters.RevalidatingAdapter`) when the
+    server confirms that the entry being refreshed is still current.
+    """
+
+
+class Revalidation(object):
+    """
+    the validators (ETag/Last-Modified) of the entry being refreshed,
+    keyed by url, and those of the responses received while refreshing.
+    """
+    def __init__(self, validators=None):
+        self.validators = validators or {}
+        self.received = {}
+
+    def conditions(self, url):
+        """
+        returns the conditional headers to fetch ``url`` with. They are
+        only sent for entries built from a single response.
+        """
+        if len(self.validators) != 1:
+            return {}
+        return self.validators.get(url, {})
+
+    def record(self, url, headers):
+        self.received[url] = dict(
+            (condition, headers[header]) for header, condition in (
+                ('ETag', 'If-None-Match'), ('Last-Modified', 'If-Modified-Since')
+            ) if header in headers
+        )
+
+    def result(self):
+        """
+        the validators to store along with the refreshed entry.
+        """
+        if len(self.received) == 1 and all(self.received.values()):
+            return self.received
+        return None
+
+
+@contextmanager
+def revalidation(validators=None):
+    previous = getattr(REVALIDATION, 'state', None)
+    REVALIDATION.state = Revalidation(validators)
+    try:
+        yield REVALIDATION.state
+    finally:
+        REVALIDATION.state = previous
+
+
+def current_revalidation():
+    return getattr(REVALIDATION, 'state', None)
+
+
+def configure(durations):
+    """
+    overrides the durations of the namespaces in ``durations`` (e.g. the
+    items of the ``[cache]`` section of the config file).
+    """
+    for namespace, duration in durations.items():
+        try:
+            DURATION_OVERRIDES[namespace] = int(duration)
+        except ValueError:
+            continue
+
+
+def namespace_duration(namespace):
+    """
+    seconds for which the entries of ``namespace`` stay fresh.
+    """
+    return DURATION_OVERRIDES.get(namespace, DURATIONS.get(namespace, CACHE_DURATION))
+
+
+def connect(path=None):
+    """
+    returns this process' connection to the cache database in
+    :data:`CACHE_DIR` (or at ``path``), creating the database if required.
+    """
+    path = path or os.path.join(CACHE_DIR, CACHE_FILE)
+    with LOCK:
+        if (os.getpid(), path) not in CONNECTIONS:
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            if not os.path.exists(path):
+                # the cache holds session cookies and tokens.
+                os.close(os.open(path, os.O_CREAT | os.O_WRONLY, 0o600))
+            connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            # with write-ahead logging, an OS crash (or power loss) can
+            # only lose the last transactions, not corrupt the database,
+            # without syncing on every commit. Where it isn't supported
+            # (e.g. on network file systems) the rollback journal is kept,
+            # fully synced.
+            if connection.execute("PRAGMA journal_mode=WAL").fetchone()[0] == 'wal':
+                connection.execute("PRAGMA synchronous=NORMAL")
+            if connection.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                migrate(connection, path)
+            CONNECTIONS[(os.getpid(), path)] = connection
+        return CONNECTIONS[(os.getpid(), path)]
+
+
+def migrate(connection, path):
+    """
+    brings the schema of the cache database at ``path`` up to
+    :data:`SCHEMA_VERSION`, removing the entries of the per-file layout
+    the cache used before it (one pickle per entry in :data:`CACHE_DIR`).
+    """
+    # the sqlite3 module of python 2 (and < 3.6) commits on its own before
+    # DDL statements, which would end the transaction below. It is left
+    # to manage the transaction itself.
+    isolation_level, connection.isolation_level = connection.isolation_level, None
+    try:
+        # take the write lock before checking the version so that processes
+        # starting together don't both apply the same step.
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            version = connection.execute("PRAGMA user_version").fetchone()[0]
+            if version < 1:
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS entries ("
+                    "key TEXT PRIMARY KEY, namespace TEXT, timestamp REAL, size INTEGER, data BLOB)"
+                )
+                connection.execute("CREATE INDEX IF NOT EXISTS entries_namespace ON entries (namespace)")
+                connection.execute("CREATE INDEX IF NOT EXISTS entries_age ON entries (timestamp, size)")
+            if version < 2:
+                connection.execute("ALTER TABLE entries ADD COLUMN validators BLOB")
+            if version < 3:
+                connection.execute("ALTER TABLE entries ADD COLUMN scope TEXT")
+            if version < 4:
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS stats ("
+                    "namespace TEXT PRIMARY KEY, hits INTEGER, misses INTEGER, refreshes INTEGER, "
+                    "duration INTEGER)"
+                )
+            if version < 5:
+                # logins are persisted next to the configuration since.
+                connection.execute("DELETE FROM entries WHERE namespace = 'session'")
+            connection.execute("PRAGMA user_version=%d" % SCHEMA_VERSION)
+            connection.execute("COMMIT")
+        except:
+            connection.execute("ROLLBACK")
+            raise
+    except sqlite3.OperationalError:
+        # another process migrated the database first.
+        if connection.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            raise
+        return
+    finally:
+        connection.isolation_level = isolation_level
+    if version < 1:
+        for legacy in glob.glob(os.path.join(os.path.dirname(path), '*.cache')):
+            try:
+                os.unlink(legacy)
+            except OSError:
+                pass
+
+
+def atomic_write(path, data):
+    """
+    writes ``data`` to a temporary file next to ``path`` and renames it
+    into place, so that readers see either the old or the new content.
+    """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            fp.write(data)
+        getattr(os, 'replace', os.rename)(tmp, path)
+    except:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def lock_fd():
+    """
+    returns this process' descriptor of the lock file in :data:`CACHE_DIR`.
+    the descriptor stays open since closing any descriptor of a file
+    releases all the record locks the process holds on it.
+    """
+    path = os.path.join(CACHE_DIR, LOCK_FILE)
+    with LOCK:
+        if (os.getpid(), path) not in LOCK_FDS:
+            if not os.path.isdir(CACHE_DIR):
+                os.makedirs(CACHE_DIR)
+            LOCK_FDS[(os.getpid(), path)] = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        return LOCK_FDS[(os.getpid(), path)]
+
+
+def evict(connection):
+    """
+    removes the oldest entries until the cache fits in :data:`CACHE_SIZE`.
+    """
+    total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+    if total <= CACHE_SIZE:
+        return
+    for key, size in connection.execute(
+        "SELECT key, size FROM entries ORDER BY timestamp"
+    ).fetchall():
+        if total <= CACHE_SIZE:
+            break
+        connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+        CachedData.memo.pop((os.path.join(CACHE_DIR, CACHE_FILE), key), None)
+        total -= size
+
+
+def cache_key(args, kwargs):
+    """
+    returns the scope and the key of the entry caching a call with
+    ``args`` and ``kwargs``. When the first argument has a
+    ``cache_scope`` (e.g. a bridge) it is used in place of the argument,
+    so that the key depends on the server and user rather than on the
+    object's repr.
+    """
+    scope = getattr(args[0], 'cache_scope', None) if args else None
+    if scope is not None:
+        args = args[1:]
+    token = json.dumps([scope, args, kwargs], sort_keys=True, default=str)
+    return scope, hashlib.md5(token.encode('utf-8')).hexdigest()
+
+
+def cached(name, duration=CACHE_DURATION):
+    DURATIONS[name] = duration
 
-def cached(name):
     def __inner(fn):
         @wraps(fn)
         def _inner(*args, **kwargs):
-            token = hashlib.md5(
-                "".join([str(k) for k in args] + [str(k) for k in kwargs.values()]).encode('utf-8')
-            ).hexdigest()
-            cached = CachedData(name + token)
-            if not cached.get():
-                resp = fn(*args, **kwargs)
-                cached.update(resp)
-            return cached.get()
+            scope, token = cache_key(args, kwargs)
+            cached = CachedData(name + token, namespace=name, scope=scope)
+            data = cached.get()
+            count(name, HIT if data else MISS)
+            if not data:
+                stale = cached.get(stale=True)
+                # only one process (or thread) fetches the entry. While it
+                # does, the others serve the expired value if there is
+                # one or wait for it and read what it stored otherwise.
+                with cached.lock(blocking=not stale) as locked:
+                    if not locked:
+                        return stale
+                    data = cached.get()
+                    if not data:
+                        count(name, REFRESH)
+                        try:
+                            data = refresh(cached, fn, *args, **kwargs)
+                        except Exception:
+                            # the expired value is served when jira
+                            # can't be reached (or fails) to refresh it.
+                            if not stale:
+                                raise
+                            return stale
+            return data
+        # lets the getters be found (and called) when warming the cache.
+        _inner.cache_namespace = name
+        _inner.cache_arguments = fn.__code__.co_argcount
         return _inner
     return __inner
 
 
+def refresh(cached, fn, *args, **kwargs):
+    """
+    stores the result of ``fn`` in ``cached``. If the (expired) entry
+    carries validators and the server confirms it is still current, it
+    is renewed instead.
+    """
+    with revalidation(cached.validators) as state:
+        try:
+            data = fn(*args, **kwargs)
+        except NotModified:
+            cached.touch()
+            return cached.get()
+    cached.update(data, validators=state.result())
+    return data
+
+
 class CachedData(object):
-    def __init__(self, name):
+    # in-process copies of entries already read from (or written to)
+    # the database, keyed by (path, name) and stored along with the
+    # time they were cached.
+    memo = {}
+
+    def __init__(self, name, namespace=None, duration=None, scope=None):
         self.name = name
+        self.namespace = name if namespace is None else namespace
+        self.scope = scope
+        self.duration = namespace_duration(self.namespace) if duration is None else duration
         self.cached = None
-        self.path = os.path.join(CACHE_DIR, self.name + '.cache')
-        if not os.path.isdir(CACHE_DIR):
-            os.makedirs(CACHE_DIR)
+        self.validators = None
+        self.path = os.path.join(CACHE_DIR, CACHE_FILE)
+        self.key = (self.path, self.name)
+
+    def update(self, data, validators=None):
+        timestamp = time.time()
+        blob = pickle.dumps(data)
+        with LOCK:
+            connection = connect()
+            with connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO entries "
+                    "(key, namespace, scope, timestamp, size, data, validators) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        self.name, self.namespace, self.scope, timestamp, len(blob),
+                        sqlite3.Binary(blob), validators and sqlite3.Binary(pickle.dumps(validators))
+                    )
+                )
+                evict(connection)
+        self.cached = data
+        self.validators = validators
+        CachedData.memo[self.key] = (timestamp, data, validators)
 
-    def update(self, data):
-        with closing(open(self.path, 'wb')) as fp:
-            self.cached = data
-            fp.write(pickle.dumps(data))
+    def touch(self):
+        """
+        marks the entry as fresh again, without changing its data.
+        """
+        timestamp = time.time()
+        with LOCK:
+            connection = connect()
+            with connection:
+                connection.execute(
+                    "UPDATE entries SET timestamp = ? WHERE key = ?", (timestamp, self.name)
+                )
+        entry = CachedData.memo.get(self.key)
+        if entry:
+            CachedData.memo[self.key] = (timestamp,) + entry[1:]
+
+    @contextmanager
+    def lock(self, blocking=True):
+        """
+        holds an exclusive advisory lock on this entry, shared by all the
+        processes and threads using :data:`CACHE_DIR`. Yields whether the
+        lock was acquired, which is only False when not ``blocking``.
+        """
+        slot = int(hashlib.md5(self.name.encode('utf-8')).hexdigest(), 16) % LOCK_SLOTS
+        with LOCK:
+            slot_lock = SLOT_LOCKS[slot]
+        if not slot_lock.acquire(blocking):
+            yield False
+            return
+        try:
+            if fcntl is None:
+                yield True
+                return
+            fd = lock_fd()
+            try:
+                fcntl.lockf(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB, 1, slot)
+            except (IOError, OSError):
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.lockf(fd, fcntl.LOCK_UN, 1, slot)
+        finally:
+            slot_lock.release()
 
     def invalidate(self):
-        if os.path.isfile(self.path):
-            os.unlink(self.path)
+        with LOCK:
+            connection = connect()
+            with connection:
+                connection.execute("DELETE FROM entries WHERE key = ?", (self.name,))
+        CachedData.memo.pop(self.key, None)
         self.cached = None
 
-    def get(self):
+    def get(self, stale=False):
+        """
+        returns the cached data or None if there is none. Expired data
+        is only returned if ``stale`` is True (it is kept until evicted
+        or replaced so that it can be served while being refreshed).
+        """
+        entry = CachedData.memo.get(self.key)
+        if entry is None or (time.time() - entry[0]) >= self.duration:
+            # another process may have refreshed it in the meantime.
+            entry = self.read()
+        if entry is None or (not stale and (time.time() - entry[0]) >= self.duration):
+            return None
+        self.cached, self.validators = entry[1:]
+        return self.cached
+
+    def read(self):
         try:
-            with closing(open(self.path, 'rb')) as fp:
-                if (time.time() - os.stat(self.path).st_mtime) >= CACHE_DURATION:
-                    self.invalidate()
-                else:
-                    self.cached = pickle.loads(fp.read())
+            with LOCK:
+                row = connect().execute(
+                    "SELECT timestamp, data, validators FROM entries WHERE key = ?", (self.name,)
+                ).fetchone()
+        except sqlite3.DatabaseError:
+            return None
+        if row is None:
+            return None
+        timestamp, blob, validators = row
+        try:
+            CachedData.memo[self.key] = (
+                timestamp, pickle.loads(bytes(blob)), validators and pickle.loads(bytes(validators))
+            )
         except AttributeError:
             self.invalidate()
-        except IOError:
             return None
-        finally:
-            return self.cached
+        return CachedData.memo[self.key]
+
+
+def clear_namespace(*namespaces):
+    """
+    removes all the entries cached under ``namespaces`` and returns how
+    many there were.
+    """
+    removed = 0
+    with LOCK:
+        connection = connect()
+        with connection:
+            for namespace in namespaces:
+                removed += connection.execute(
+                    "DELETE FROM entries WHERE namespace = ?", (namespace,)
+                ).rowcount
+    CachedData.memo.clear()
+    return removed
+
+
+def count(namespace, counter):
+    with LOCK:
+        COUNTERS[os.path.join(CACHE_DIR, CACHE_FILE)][namespace][counter] += 1
+
+
+def flush_counters():
+    """
+    adds the counters recorded by this process to the stats table of
+    the databases they were recorded for.
+    """
+    with LOCK:
+        for path, namespaces in list(COUNTERS.items()):
+            try:
+                connection = connect(path)
+                with connection:
+                    for namespace, (hits, misses, refreshes) in namespaces.items():
+                        connection.execute(
+                            "INSERT OR IGNORE INTO stats VALUES (?, 0, 0, 0, ?)",
+                            (namespace, namespace_duration(namespace))
+                        )
+                        connection.execute(
+                            "UPDATE stats SET hits = hits + ?, misses = misses + ?, "
+                            "refreshes = refreshes + ?, duration = ? WHERE namespace = ?",
+                            (hits, misses, refreshes, namespace_duration(namespace), namespace)
+                        )
+            except sqlite3.DatabaseError:
+                pass
+            COUNTERS.pop(path)
+
+
+atexit.register(flush_counters)
+
+
+def stats():
+    """
+    returns, for each namespace, the number of entries, their size, the
+    age of the oldest one, the duration for which they stay fresh and
+    the hits, misses and refreshes recorded by all processes.
+    """
+    flush_counters()
+    namespaces = defaultdict(lambda: {
+        'entries': 0, 'size': 0, 'age': None, 'hits': 0, 'misses': 0, 'refreshes': 0
+    })
+    with LOCK:
+        connection = connect()
+        for namespace, entries, size, oldest in connection.execute(
+            "SELECT namespace, COUNT(*), SUM(size), MIN(timestamp) FROM entries GROUP BY namespace"
+        ).fetchall():
+            namespaces[namespace].update(entries=entries, size=size, age=time.time() - oldest)
+        durations = {}
+        for namespace, hits, misses, refreshes, duration in connection.execute(
+            "SELECT namespace, hits, misses, refreshes, duration FROM stats"
+        ).fetchall():
+            namespaces[namespace].update(hits=hits, misses=misses, refreshes=refreshes)
+            durations[namespace] = duration
+    for namespace, stat in namespaces.items():
+        # the getters declaring the durations may not have been imported
+        # by this process, in which case the last recorded one is used.
+        if namespace in DURATIONS or namespace in DURATION_OVERRIDES or namespace not in durations:
+            stat['duration'] = namespace_duration(namespace)
+        else:
+            stat['duration'] = durations[namespace]
+    return dict(namespaces)
 
 
 def clear_cache(*cached_data):
     if not cached_data:
-        if os.path.isdir(CACHE_DIR):
-            shutil.rmtree(CACHE_DIR)
+        with LOCK:
+            for key in list(CONNECTIONS):
+                if key[1] == os.path.join(CACHE_DIR, CACHE_FILE):
+                    CONNECTIONS.pop(key).close()
+            for key in list(LOCK_FDS):
+                if key[1] == os.path.join(CACHE_DIR, LOCK_FILE):
+                    os.close(LOCK_FDS.pop(key))
+            COUNTERS.pop(os.path.join(CACHE_DIR, CACHE_FILE), None)
+            if os.path.isdir(CACHE_DIR):
+                shutil.rmtree(CACHE_DIR)
+        CachedData.memo.clear()
     else:
         for data in cached_data:
             data.invalidate()
@@ -1,9 +1,36 @@
-try:
-    from jira.utils import JIRAError
-except:  # pragma: no cover
-    from jira.exceptions import JIRAError
+import sys
 
-from suds import WebFault
+
+def jira_error():
+    """
+    the exception type raised by the jira (rest) client.
+    """
+    try:
+        from jira.utils import JIRAError
+    except:  # pragma: no cover
+        from jira.exceptions import JIRAError
+    return JIRAError
+
+
+def web_fault():
+    """
+    the exception type raised by the suds (soap) client.
+    """
+    from suds import WebFault
+    return WebFault
+
+
+def protocol_errors():
+    """
+    the exception types of the protocol libraries that have been
+    loaded so far (none of them are imported until a bridge is).
+    """
+    errors = ()
+    if 'suds' in sys.modules:
+        errors += (web_fault(),)
+    if 'jira' in sys.modules:
+        errors += (jira_error(),)
+    return errors
 
 
 class JiraInitializationError(Exception):
@@ -23,10 +50,10 @@ class UsageWarning(Exception):
 
 class JiraCliError(Exception):
     def __init__(self, exc):
-        if isinstance(exc, WebFault):
+        if 'suds' in sys.modules and isinstance(exc, web_fault()):
             msg = ":".join(exc.fault.faultstring.split(":")[1:]).strip()
             super(JiraCliError, self).__init__(msg)
-        elif isinstance(exc, JIRAError):
+        elif 'jira' in sys.modules and isinstance(exc, jira_error()):
             if exc.status_code == 401:
                 super(JiraCliError, self).__init__("invalid username/password")
             else:
@@ -3,29 +3,41 @@
 """
 import argparse
 import shlex
-import keyring
 
-from suds import WebFault
 import sys
 from jiracli import __version__
-from jiracli.bridge import get_bridge
 from jiracli.cache import clear_cache
-from jiracli.errors import JIRAError
 from jiracli.errors import JiraAuthenticationError, JiraInitializationError
 from jiracli.errors import UsageWarning, JiraCliError, UsageError
+from jiracli.errors import protocol_errors
 from jiracli.processor import ViewCommand, AddCommand, UpdateCommand
-from jiracli.processor import ListCommand
+from jiracli.processor import ListCommand, CacheCommand
 from jiracli.utils import print_error, WARNING, Config, colorfunc, prompt, \
     print_output
-from jiracli.cli import main as old_main
+
+
+def old_main():
+    from jiracli.cli import main
+    return main()
 
 
 def initialize(config, base_url=None, username=None, password=None,
-               persist=True, error=False, protocol='soap', reset=False):
+               persist=True, error=False, protocol='soap', reset=False, resume=True):
+    # the bridges (and the protocol libraries they use) are only
+    # imported once a command actually needs to talk to jira.
+    from jiracli.bridge import get_bridge
     url = base_url or config.base_url
     auth_method = config.auth_method
     bridge = get_bridge(protocol)(url, config, persist) if (url and not error) else None
+    # a recent login is trusted without a round trip to jira. If it has
+    # expired after all, the bridge logs in again through this callback.
+    if bridge and resume and not (username or password or reset) and bridge.resume():
+        bridge.reauthenticate = lambda: initialize(
+            config, base_url=url, persist=persist, protocol=protocol, resume=False
+        )
+        return bridge
     if error or not (url and bridge and bridge.ping()):
+        import keyring
         url = url or prompt("Base url for the jira instance: ")
         if not auth_method:
             auth_method = prompt(
@@ -174,7 +186,7 @@ def build_parser():
     base.add_argument('-p', '--password', dest='password',
                       help='password for jira instance', default=None)
     base.add_argument('--protocol', dest='protocol',
-                      choices=['soap', 'rest'], help='the protocol to use to communicate with jira')
+                      choices=['soap', 'rest', 'rest-async'], help='the protocol to use to communicate with jira')
 
     view = subparsers.add_parser('view', parents=[base], help='view/list/search for issues')
     view.set_defaults(cmd=ViewCommand)
@@ -187,6 +199,23 @@ def build_parser():
     update.set_defaults(cmd=UpdateCommand)
     list = subparsers.add_parser('list', parents=[base], help='list jira types and properties')
     list.set_defaults(cmd=ListCommand)
+    cache = subparsers.add_parser('cache', help='manage the jira-cli cache')
+    cache.set_defaults(cmd=CacheCommand)
+    cache_commands = cache.add_subparsers(dest='cache_command', title='cache commands')
+    cache_commands.required = True
+    warm = cache_commands.add_parser(
+        'warm', parents=[base], help='fetch the jira metadata used by jira-cli into the cache'
+    )
+    warm.add_argument('--project', dest='projects', action='append',
+                      help='project(s) to also cache the components and versions of')
+    stats = cache_commands.add_parser(
+        'stats', help='show the entries, age and hit rate of each cached namespace'
+    )
+    stats.set_defaults(login=False)
+    clear = cache_commands.add_parser('clear', help='remove cached entries')
+    clear.add_argument('namespaces', nargs='*', metavar='namespace',
+                       help='namespace(s) to clear (all of the cache if none are given)')
+    clear.set_defaults(login=False)
 
     search_args = view.add_mutually_exclusive_group(required=False)
     search_args.add_argument('--search', dest='search_freetext')
@@ -200,6 +229,11 @@ def build_parser():
     view.add_argument('--comments-only', dest='comments_only',
                       help='displays only the comments assosciated with each issue',
                       action='store_true')
+    view.add_argument('--output', dest='output', choices=['text', 'ndjson', 'csv', 'tsv'],
+                      default='text',
+                      help='write issues as colored text (default) or as one ndjson, csv or tsv '
+                           'record per issue (the fields used can be picked with --format, '
+                           'statuses, priorities and types are written by name)')
     view.add_argument('jira_ids', nargs='*', help='jira issue ids')
 
     list.add_argument('type', choices=['filters', 'projects', 'issue_types',
@@ -332,11 +366,13 @@ def cli(args=sys.argv[1:]):
             not (pre_opts and ("configure" in pre_args or "clear_cache" in pre_args))
         ):
             post_args = parser.parse_args(args)
-            jira = initialize(
-                config, post_args.jira_url, post_args.username, post_args.password,
-                persist=not (post_args.username or post_args.jira_url),
-                protocol=post_args.protocol or config.protocol or 'rest'
-            )
+            jira = None
+            if getattr(post_args, 'login', True):
+                jira = initialize(
+                    config, post_args.jira_url, post_args.username, post_args.password,
+                    persist=not (post_args.username or post_args.jira_url),
+                    protocol=post_args.protocol or config.protocol or 'rest'
+                )
             return post_args.cmd(jira, post_args).execute()
         else:
             if "configure" in pre_args:
@@ -357,9 +393,7 @@ def cli(args=sys.argv[1:]):
         print_error(str(e), severity=WARNING)
     except (JiraCliError, UsageError) as e:
         print_error(str(e))
-    except (WebFault) as e:
-        print_error(JiraCliError(e))
-    except (JIRAError) as e:
+    except protocol_errors() as e:
         print_error(JiraCliError(e))
     except NotImplementedError as e:
         print_error(e)
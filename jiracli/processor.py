@@ -4,19 +4,29 @@
 import sys
 from abc import ABCMeta, abstractmethod
 
+import csv
 import json
 import pprint
 import six
 
-from jiracli.cli import colorfunc
+from jiracli import cache
 from jiracli.errors import UsageError, UsageWarning
-from jiracli.utils import get_text_from_editor, print_output, Config
+from jiracli.utils import get_text_from_editor, print_output, print_error, Config, chunked, \
+    FormatTemplate, plain_value, colorfunc, WARNING
 
 try:
     from collections import OrderedDict
 except ImportError:
     from ordereddict import OrderedDict
 
+BATCH_SIZE = 50
+# fields written by the machine readable output modes of
+# ViewCommand when no --format is given.
+RECORD_FIELDS = [
+    'key', 'status', 'priority', 'type', 'summary',
+    'assignee', 'reporter', 'created', 'updated'
+]
+
 
 @six.add_metaclass(ABCMeta)
 class Command(object):
@@ -56,18 +66,27 @@ class ViewCommand(Command):
     def eval(self):
         if self.args.oneline:
             mode = -1
-        elif self.args.verbosity > 1:
+        elif self.args.verbosity:
             mode = self.args.verbosity
         else:
             mode = 0
+        formatter = FormatTemplate(self.args.format) if self.args.format else None
+        fields = self.fields(mode, formatter)
         if self.args.search_freetext:
-            issues = self.jira.search_issues(self.args.search_freetext, project=self.args.project)
+            issues = self.jira.search_issues(
+                self.args.search_freetext, project=self.args.project, fields=fields
+            )
         elif self.args.search_jql:
-            issues = self.jira.search_issues_jql(self.args.search_jql)
+            issues = self.jira.search_issues_jql(self.args.search_jql, fields=fields)
         elif self.args.filter:
-            issues = self.jira.get_issues_by_filter(*self.args.filter)
+            issues = self.jira.get_issues_by_filter(*self.args.filter, fields=fields)
         else:
-            issues = filter(lambda issue: issue is not None, [self.jira.get_issue(jira) for jira in self.args.jira_ids])
+            issues = self.jira.get_issues(self.args.jira_ids, fields=fields)
+        if self.args.output != 'text':
+            return self.write_records(issues)
+        # a --format template never reads the comments or sub-tasks.
+        if not formatter and (mode > 0 or self.args.comments_only):
+            issues = self.prefetch(issues, mode)
 
         for issue in issues:
             if self.args.debug:
@@ -75,10 +94,82 @@ class ViewCommand(Command):
             print_output(self.jira.format_issue(
                 issue,
                 mode=mode,
-                formatter=self.args.format,
+                formatter=formatter,
                 comments_only=self.args.comments_only
             ))
 
+    def fields(self, mode, formatter):
+        """
+        returns the fields of the issues that will be written (None if
+        all of them are).
+        """
+        if self.args.output == 'text':
+            return self.jira.display_fields(
+                mode, formatter=formatter, comments_only=self.args.comments_only
+            )
+        if formatter:
+            return formatter.fields
+        return None if self.args.output == 'ndjson' else RECORD_FIELDS
+
+    def write_records(self, issues):
+        """
+        writes one ndjson, csv or tsv record per issue as the issues arrive.
+        the fields written are those used in --format (or
+        :data:`RECORD_FIELDS`), except for ndjson without --format, which
+        writes the complete issue. values are written without colors,
+        with statuses, priorities and types by name (see
+        :meth:`jiracli.bridge.JiraBridge.record_value`).
+        """
+        # the bridges are only loaded once a command needs them.
+        from jiracli.bridge import SPECIAL_FIELDS
+        fields = FormatTemplate(self.args.format).fields if self.args.format else RECORD_FIELDS
+        if self.args.output == 'ndjson':
+            for issue in issues:
+                if self.args.format:
+                    issue = dict((field, self.jira.record_value(issue, field)) for field in fields)
+                else:
+                    issue = dict(issue)
+                    for field in SPECIAL_FIELDS:
+                        if field in issue:
+                            issue[field] = self.jira.record_value(issue, field)
+                sys.stdout.write(json.dumps(plain_value(issue), sort_keys=True, default=str) + "\n")
+        else:
+            writer = csv.writer(sys.stdout, 'excel' if self.args.output == 'csv' else 'excel-tab')
+            writer.writerow(fields)
+            for issue in issues:
+                writer.writerow([record_cell(self.jira.record_value(issue, field)) for field in fields])
+
+    def prefetch(self, issues, mode):
+        """
+        attaches the comments or sub-tasks needed to display ``issues``
+        a batch at a time so that they aren't fetched one issue at a
+        time while formatting.
+        """
+        for batch in chunked(issues, BATCH_SIZE):
+            if mode == 1 or self.args.comments_only:
+                self.jira.add_comments(batch)
+            elif mode > 1:
+                self.jira.add_children(batch)
+            for issue in batch:
+                yield issue
+
+
+def record_cell(value):
+    """
+    flattens an issue value in to the text of a csv/tsv cell.
+    """
+    value = plain_value(value)
+    if value is None:
+        return ""
+    elif isinstance(value, list):
+        return ", ".join(record_cell(k) for k in value)
+    elif isinstance(value, dict):
+        for key in ('name', 'key', 'id', 'value'):
+            if key in value:
+                return record_cell(value[key])
+        return json.dumps(value, sort_keys=True, default=str)
+    return six.text_type(value)
+
 
 class ListCommand(Command):
     def eval(self):
@@ -261,3 +352,52 @@ class AddCommand(Command):
                 self.args.issue_reporter, self.args.labels, components, **extras
             )
         ))
+
+
+class CacheCommand(Command):
+    def eval(self):
+        if self.args.cache_command == 'warm':
+            failures = 0
+            for getter, error in self.jira.warm_cache(self.args.projects or []):
+                if error:
+                    failures += 1
+                    print_error("%s: %s" % (getter, error), severity=WARNING)
+                else:
+                    print_output(colorfunc(getter, 'green'))
+            if failures:
+                raise UsageWarning("%d of the cached lookups failed" % failures)
+        elif self.args.cache_command == 'stats':
+            cache.configure(Config(section='cache').items())
+            namespaces = cache.stats()
+            if not namespaces:
+                raise UsageWarning("the jira-cli cache is empty")
+            row = "%-24s %8s %10s %8s %8s %8s %8s %10s"
+            print_output(colorfunc(
+                row % ("namespace", "entries", "bytes", "age", "ttl", "hits", "misses", "refreshes"),
+                'white'
+            ))
+            for namespace in sorted(namespaces):
+                stat = namespaces[namespace]
+                print_output(row % (
+                    namespace, stat['entries'], stat['size'], format_duration(stat['age']),
+                    format_duration(stat['duration']), stat['hits'], stat['misses'],
+                    stat['refreshes']
+                ))
+        elif self.args.cache_command == 'clear':
+            if not self.args.namespaces:
+                cache.clear_cache()
+                print_output(colorfunc("jira-cli cache cleared", "green"))
+                return
+            removed = cache.clear_namespace(*self.args.namespaces)
+            if not removed:
+                raise UsageWarning("nothing cached under %s" % ", ".join(self.args.namespaces))
+            print_output(colorfunc("removed %d cached entries" % removed, "green"))
+
+
+def format_duration(seconds):
+    if seconds is None:
+        return "-"
+    for unit, size in (('d', 60*60*24), ('h', 60*60), ('m', 60)):
+        if seconds >= size:
+            return "%d%s" % (seconds // size, unit)
+    return "%ds" % seconds
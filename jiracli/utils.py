@@ -2,22 +2,38 @@
 utility functions
 """
 
+import datetime
 import getpass
+from itertools import islice
 import os
+import re
 import tempfile
 import sys
 from six.moves import configparser, input
-from jira import resources
-from suds.sudsobject import asdict
 
 import logging
 
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads
+
+    def json_loads(data):
+        """
+        json.loads, which only accepts bytes as of python 3.6.
+        """
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        return loads(data)
+
 requests_log = logging.getLogger("requests")
 requests_log.setLevel(logging.WARNING)
 
 CONFIG_DIR = os.path.expanduser('~/.jira-cli')
 CONFIG_FILE = os.path.join(CONFIG_DIR, 'config.cfg')
 COLOR = True
+HTTP_POOL_SIZE = 16
+SESSION = None
 DEFAULT_EDITOR_TEXT = """-- enter your text here
 -- all lines starting with '--' will be removed"""
 
@@ -76,11 +92,40 @@ class Config(object):
                 return None
 
 
+def get_session():
+    """
+    returns the pooled :class:`requests.Session` shared by everything
+    that talks to jira in this process, so that connections (and TLS
+    handshakes) are reused across the bridges and their clients.
+    """
+    global SESSION
+    if SESSION is None:
+        import requests
+        from jiracli.adapters import RevalidatingAdapter
+        SESSION = requests.Session()
+        adapter = RevalidatingAdapter(pool_maxsize=HTTP_POOL_SIZE)
+        SESSION.mount('http://', adapter)
+        SESSION.mount('https://', adapter)
+    return SESSION
+
+
+def share_connections(session):
+    """
+    mounts the connection pools of the shared session on ``session``
+    (e.g. the session of a :class:`jira.client.JIRA` instance, which
+    carries its own authentication).
+    """
+    for prefix, adapter in get_session().adapters.items():
+        session.mount(prefix, adapter)
+    return session
+
+
 def soap_recursive_dict(d):
     """
     recursively serializes a soap dictionary in to
     a pure python dictionary.
     """
+    from suds.sudsobject import asdict
     out = {}
     for k, v in asdict(d).items():
         if hasattr(v, '__keylist__'):
@@ -111,24 +156,139 @@ def rest_recursive_dict(d):
     return out
 
 
+def plain_value(value):
+    """
+    reduces the values found in cleaned issues (jira resources,
+    property holders, dates etc.) to json serializable data.
+    """
+    from jira import resources
+    if isinstance(value, (list, tuple)):
+        return [plain_value(k) for k in value]
+    elif isinstance(value, dict):
+        return dict((k, plain_value(v)) for k, v in value.items())
+    elif isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    elif isinstance(value, resources.Resource):
+        return value.raw
+    elif hasattr(value, '__dict__'):
+        return plain_value(value.__dict__)
+    return value
+
+
+# resource types (as named in the path of their self link) that
+# cleaned issues refer to by one of their attributes.
+RESOURCE_IDS = {
+    'user': 'name',
+    'issuetype': 'id',
+    'status': 'id',
+    'priority': 'id',
+    'component': 'id',
+    'issue': 'key',
+}
+RESOURCE_CLASSES = {}
+# the attributes jira.resources.Resource.__str__ looks for, in order.
+READABLE_IDS = (
+    'displayName', 'key', 'name', 'accountId', 'filename', 'value', 'scope', 'votes', 'id',
+    'mimeType', 'closed'
+)
+
+
 def map_rest_resource(resource):
     """
     convert jira.resource types to their id/key
     mappings as expected by the formatter/cli
     code.
     """
-    resource_mapping = {
-        resources.User: 'name',
-        resources.IssueType: 'id',
-        resources.Status: 'id',
-        resources.Priority: 'id',
-        resources.Component: 'id',
-    }
-    if type(resource) in resource_mapping:
-        return getattr(resource, resource_mapping[type(resource)])
+    if not RESOURCE_CLASSES:
+        from jira import resources
+        RESOURCE_CLASSES.update({
+            resources.User: 'name',
+            resources.IssueType: 'id',
+            resources.Status: 'id',
+            resources.Priority: 'id',
+            resources.Component: 'id',
+            resources.Issue: 'key',
+        })
+    if type(resource) in RESOURCE_CLASSES:
+        return getattr(resource, RESOURCE_CLASSES[type(resource)])
     return resource
 
 
+class RawResource(dict):
+    """
+    the json of a resource (or of a nested object) of an issue, standing
+    in for the jira.resources object it would otherwise be turned into:
+    its values can be read as attributes and it prints the same way.
+    """
+    def __getattr__(self, name):
+        try:
+            value = self[name]
+        except KeyError:
+            raise AttributeError(name)
+        return RawResource(value) if type(value) is dict else value
+
+    def __str__(self):
+        for name in READABLE_IDS:
+            if name in self:
+                return str(self[name])
+        return dict.__repr__(self)
+
+
+RESOURCE_PATH = re.compile(r"/rest/api/\w+/(\w+)(?:/[^/?]*)?(?:\?.*)?$")
+
+
+def clean_rest_value(value):
+    """
+    converts a field of the json of an issue the way
+    :func:`map_rest_resource` converts the resources parsed from it.
+    """
+    if type(value) is dict:
+        if 'self' in value:
+            match = RESOURCE_PATH.search(value['self'])
+            if match and match.group(1) in RESOURCE_IDS:
+                return value.get(RESOURCE_IDS[match.group(1)])
+        return RawResource(value)
+    elif type(value) is list:
+        return [RawResource(k) if type(k) is dict else k for k in value]
+    return value
+
+
+class FormatTemplate(object):
+    """
+    a ``--format`` string parsed once into the literal text and
+    ``%token`` fields it is made up of.
+    """
+    TOKEN = re.compile(r"%(\w+)")
+
+    def __init__(self, template):
+        self.template = template
+        self.segments = []
+        position = 0
+        for match in self.TOKEN.finditer(template):
+            self.segments.append((template[position:match.start()], match.group(1).lower()))
+            position = match.end()
+        self.tail = template[position:]
+        self.fields = []
+        for _, field in self.segments:
+            if field not in self.fields:
+                self.fields.append(field)
+
+    def render(self, value):
+        """
+        renders the template in a single pass, calling ``value``
+        with the name of each field to get its text.
+        """
+        parts = []
+        for literal, field in self.segments:
+            parts.append(literal)
+            parts.append(value(field))
+        parts.append(self.tail)
+        return "".join(parts)
+
+    def __str__(self):
+        return self.template
+
+
 from termcolor import colored as colorfunc
 
 if not sys.stdout.isatty():
@@ -158,6 +318,19 @@ CRITICAL = 0
 WARNING = 1
 
 
+def chunked(iterable, size):
+    """
+    yields lists of at most ``size`` consecutive items
+    from ``iterable``.
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
 def print_error(msg, severity=CRITICAL):
     color = 'red' if severity == CRITICAL else 'yellow'
     sys.stderr.write(colorfunc(msg, color) + "\n")
@@ -10,89 +10,83 @@ jiravcr = vcr.VCR(
 )
 
 class BridgeTests:
+    def cassette(self, name):
+        return jiravcr.use_cassette(os.path.join(self.vcr_directory, name))
+
     def test_get_issue(self):
-        with jiravcr.use_cassette(os.path.join(self.vcr_directory, "issue.yaml")):
+        with self.cassette("issue.yaml"):
             self.assertIsNotNone(self.bridge.get_issue("TP-9"))
 
     def test_get_statuses(self):
-        with jiravcr.use_cassette(os.path.join(self.vcr_directory, "status.yaml")):
+        with self.cassette("status.yaml"):
             self.assertIsNotNone(self.bridge.get_statuses())
 
     def test_get_projects(self):
-        with jiravcr.use_cassette(os.path.join(self.vcr_directory, "project.yaml")):
+        with self.cassette("project.yaml"):
             self.assertIsNotNone(self.bridge.get_projects())
 
     def test_get_priorities(self):
-        with jiravcr.use_cassette(
-                os.path.join(self.vcr_directory, "priorities.yaml")):
+        with self.cassette("priorities.yaml"):
             self.assertIsNotNone(self.bridge.get_priorities())
 
     def test_get_transitions(self):
-        with jiravcr.use_cassette(
-                os.path.join(self.vcr_directory, "transitions.yaml")):
+        with self.cassette("transitions.yaml"):
             self.assertIsNotNone(self.bridge.get_available_transitions("TP-9"))
 
     def test_get_resolutions(self):
-        with jiravcr.use_cassette(
-                os.path.join(self.vcr_directory, "resolutions.yaml")):
+        with self.cassette("resolutions.yaml"):
             self.assertIsNotNone(self.bridge.get_resolutions())
 
     def test_get_project_components(self):
-        with jiravcr.use_cassette(
-                os.path.join(self.vcr_directory, "components.yaml")):
+        with self.cassette("components.yaml"):
             self.assertIsNotNone(self.bridge.get_components("TP"))
 
     def test_get_issue_types(self):
-        with jiravcr.use_cassette(os.path.join(self.vcr_directory, "types.yaml")):
+        with self.cassette("types.yaml"):
             self.assertIsNotNone(self.bridge.get_issue_types())
 
     def test_get_sub_task_issue_types(self):
-        with jiravcr.use_cassette(
-                os.path.join(self.vcr_directory, "subtypes.yaml")):
+        with self.cassette("subtypes.yaml"):
             self.assertIsNotNone(self.bridge.get_issue_types())
 
     def test_get_filters(self):
-        with jiravcr.use_cassette(os.path.join(self.vcr_directory, "filters.yaml")):
+        with self.cassette("filters.yaml"):
             self.assertIsNotNone(self.bridge.get_filters())
 
     def test_search_free_text(self):
-        with jiravcr.use_cassette(os.path.join(self.vcr_directory, "search.yaml")):
+        with self.cassette("search.yaml"):
             self.assertTrue(
                 len(
-                    self.bridge.search_issues("test jira-cli")
+                    list(self.bridge.search_issues("test jira-cli"))
                 ) == 1)
 
     def test_search_jql(self):
-        with jiravcr.use_cassette(
-                os.path.join(self.vcr_directory, "search-jql.yaml")):
+        with self.cassette("search-jql.yaml"):
             self.assertTrue(
                 len(
-                    self.bridge.search_issues_jql("summary~jira-cli")
+                    list(self.bridge.search_issues_jql("summary~jira-cli"))
                 ) == 1)
 
     def test_filter_fail(self):
-        with jiravcr.use_cassette(
-                os.path.join(self.vcr_directory, "filter-search-fail.yaml")):
+        with self.cassette("filter-search-fail.yaml"):
             self.assertIsNotNone(
-                self.bridge.get_issues_by_filter("test-filter")
+                list(self.bridge.get_issues_by_filter("test-filter"))
             )
 
     def test_filter_fail(self):
-        with jiravcr.use_cassette(
-                os.path.join(self.vcr_directory, "filter-search.yaml")):
+        with self.cassette("filter-search.yaml"):
             self.assertIsNotNone(
-                self.bridge.get_issues_by_filter("test filter", "blah")
+                list(self.bridge.get_issues_by_filter("test filter", "blah"))
             )
 
     def test_create_issue(self):
-        with jiravcr.use_cassette(os.path.join(self.vcr_directory, "create.yaml")):
+        with self.cassette("create.yaml"):
             self.assertIsNotNone(
                 self.bridge.create_issue("TP", summary='test-create-issue')
             )
 
     def test_create_child_issue(self):
-        with jiravcr.use_cassette(
-                os.path.join(self.vcr_directory, "childcreate.yaml")):
+        with self.cassette("childcreate.yaml"):
             self.assertIsNotNone(
                 self.bridge.create_issue("TP", type='sub-task',
                                          summary='test-create-issue',
@@ -0,0 +1,90 @@
+"""
+python 3 only (imported by the tests of the rest-async bridge when
+aiohttp is available).
+"""
+import asyncio
+from contextlib import contextmanager
+import threading
+
+from aiohttp import web
+
+# headers of the recorded responses that are replayed.
+REPLAYED_HEADERS = ('content-type', 'content-encoding', 'x-ausername')
+
+
+class ReplayServer(object):
+    """
+    aiohttp server (on a loop of its own) that answers with the responses
+    recorded in a vcr cassette, matched on the path and method like
+    :data:`tests.common_bridge_cases.jiravcr` does.
+    """
+    def __init__(self, delay=0):
+        self.delay = delay
+        # answer requests without credentials with a 401.
+        self.require_auth = False
+        self.responses = {}
+        self.requests = []
+        self.in_flight = self.max_in_flight = 0
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.runner = self.run(self.serve())
+        self.url = "http://127.0.0.1:%d" % self.runner.addresses[0][1]
+
+    def run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    async def serve(self):
+        app = web.Application()
+        app.router.add_route('*', '/{path:.*}', self.handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, '127.0.0.1', 0).start()
+        return runner
+
+    async def handle(self, request):
+        if not request.path.startswith('/rest'):
+            # the redirect probe of the bridge.
+            return web.Response(status=200)
+        self.requests.append((request.method, request.path, dict(request.query)))
+        if self.require_auth and 'Authorization' not in request.headers:
+            return web.Response(status=401, text='{"errorMessages": ["unauthorized"]}')
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        try:
+            response = self.responses[(request.method, request.path)]
+        except KeyError:
+            return web.Response(status=404, text='{"errorMessages": ["not recorded"]}')
+        headers = dict(
+            (name, values[0]) for name, values in response['headers'].items()
+            if name.lower() in REPLAYED_HEADERS
+        )
+        return web.Response(
+            status=response['status']['code'], body=response['body']['string'], headers=headers
+        )
+
+    @contextmanager
+    def use_cassette(self, path):
+        from vcr.serialize import deserialize
+        from vcr.serializers import yamlserializer
+        with open(path) as fp:
+            requests, responses = deserialize(fp.read(), yamlserializer)
+        self.responses = dict(
+            ((request.method, request.path), response)
+            for request, response in zip(requests, responses)
+        )
+        try:
+            yield self
+        finally:
+            self.responses = {}
+
+    def close(self):
+        self.run(self.runner.cleanup())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
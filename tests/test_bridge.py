@@ -0,0 +1,675 @@
+"""
+
+"""
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import unittest
+
+import mock
+from jira.exceptions import JIRAError
+from jira.resources import Issue
+from requests import RequestException
+from six.moves import BaseHTTPServer, socketserver
+from suds.transport import Request
+
+import jiracli
+from jiracli.bridge import JiraBridge, auth_user
+from jiracli.bridge.rest import JiraRestBridge
+from jiracli.bridge.soap import RequestsTransport
+from jiracli.errors import UsageError
+from jiracli.utils import Config, FormatTemplate, get_session, plain_value
+
+
+class BridgeTestCase(unittest.TestCase):
+    """
+    gives each test an empty cache and a rest bridge of http://jira.local
+    (built without checking the url for redirects).
+    """
+    def setUp(self):
+        jiracli.cache.CACHE_DIR = tempfile.mkdtemp()
+        self.config = Config(tempfile.mktemp())
+        self.bridge = self.make_bridge(config=self.config)
+
+    def make_bridge(self, url="http://jira.local", config=None):
+        with mock.patch("jiracli.bridge.JiraBridge._check_redirect") as redirect:
+            redirect.side_effect = lambda url: url
+            return JiraRestBridge(url, config or Config(tempfile.mktemp()))
+
+
+class BridgeIndexTests(BridgeTestCase):
+    def setUp(self):
+        super(BridgeIndexTests, self).setUp()
+        self.statuses = {
+            "open": {"id": "1", "name": "Open"},
+            "closed": {"id": "6", "name": "Closed"},
+        }
+
+    def test_object_from_key(self):
+        getter = mock.Mock(return_value=self.statuses, __name__="get_statuses")
+        self.assertEqual(self.bridge.object_from_key("6", getter)["name"], "Closed")
+        self.assertEqual(self.bridge.object_from_key("open", getter, key="name")["id"], "1")
+        self.assertEqual(self.bridge.object_from_key("42", getter), {})
+
+    def test_index_rebuilt_on_change(self):
+        getter = mock.Mock(return_value=self.statuses, __name__="get_statuses")
+        index = self.bridge.get_index(getter)
+        for _ in range(10):
+            self.assertTrue(self.bridge.get_index(getter) is index)
+        getter.return_value = {"done": {"id": "7", "name": "Done"}}
+        self.assertEqual(self.bridge.object_from_key("7", getter)["name"], "Done")
+        self.assertEqual(self.bridge.object_from_key("6", getter), {})
+
+    def test_index_per_getter(self):
+        statuses = lambda: self.statuses
+        priorities = lambda: {"major": {"id": "1", "name": "Major"}}
+        self.assertEqual(self.bridge.object_from_key("1", statuses)["name"], "Open")
+        self.assertEqual(self.bridge.object_from_key("1", priorities)["name"], "Major")
+        self.assertTrue(self.bridge.get_index(statuses) is self.bridge.get_index(statuses))
+
+
+class CacheScopeTests(BridgeTestCase):
+    def user_bridge(self, user, url="http://jira.local"):
+        bridge = self.make_bridge(url)
+        bridge.user = user
+        bridge.jira = mock.Mock()
+        favourite = mock.Mock(raw={"id": user, "name": user + "'s filter"})
+        favourite.name = user
+        bridge.jira.favourite_filters.return_value = [favourite]
+        return bridge
+
+    def test_scope_per_user(self):
+        self.assertEqual(list(self.user_bridge("alice").get_filters()), ["alice"])
+        self.assertEqual(list(self.user_bridge("bob").get_filters()), ["bob"])
+        self.assertEqual(list(self.user_bridge("alice").get_filters()), ["alice"])
+
+    def test_scope_per_server(self):
+        self.assertEqual(list(self.user_bridge("alice").get_filters()), ["alice"])
+        other = self.user_bridge("bob", url="http://other.local")
+        other.user = "alice"
+        self.assertEqual(list(other.get_filters()), ["bob"])
+
+    def test_scope_follows_login(self):
+        self.assertEqual(self.bridge.cache_scope, "rest http://jira.local ")
+        self.bridge.login(basic_auth=("alice", "password"))
+        self.assertEqual(self.bridge.cache_scope, "rest http://jira.local alice")
+        self.assertNotIn("secret", auth_user({"oauth": {"access_token": "secret"}}))
+
+
+class WarmCacheTests(BridgeTestCase):
+    def setUp(self):
+        super(WarmCacheTests, self).setUp()
+        self.bridge.jira = mock.Mock()
+        resource = mock.Mock(raw={"id": "1", "name": "one"}, id="1", subtask=False)
+        resource.name = "one"
+        for getter in ["resolutions", "favourite_filters", "issue_types", "projects",
+                       "priorities", "statuses", "project_components"]:
+            getattr(self.bridge.jira, getter).return_value = [resource]
+        self.bridge.jira.project.return_value.versions = [resource]
+
+    def test_warm(self):
+        self.bridge.jira.favourite_filters.side_effect = ValueError("forbidden")
+        errors = dict(self.bridge.warm_cache(["TP"]))
+        self.assertEqual(
+            sorted(name for name, error in errors.items() if not error),
+            ["get_components TP", "get_issue_types", "get_priorities", "get_projects",
+             "get_resolutions", "get_statuses", "get_subtask_issue_types", "list_versions TP"]
+        )
+        self.assertEqual(str(errors["get_filters"]), "forbidden")
+        self.bridge.jira = mock.Mock()
+        self.bridge.get_statuses(), self.bridge.get_components("TP"), self.bridge.list_versions("TP")
+        self.assertEqual(self.bridge.jira.mock_calls, [])
+
+    def test_reported_as_completed(self):
+        release = threading.Event()
+        self.bridge.jira.statuses.side_effect = lambda: release.wait(5) and []
+        warming = self.bridge.warm_cache()
+        name, error = next(warming)
+        self.assertNotEqual(name, "get_statuses")
+        release.set()
+        self.assertIn("get_statuses", dict(warming))
+
+
+class RestSearchTests(BridgeTestCase):
+    def setUp(self):
+        super(RestSearchTests, self).setUp()
+        self.bridge.clean_raw_issue = lambda issue: {"key": issue}
+        self.issues = ["TP-%d" % i for i in range(250)]
+
+        def search_page(query, start, size, fields=None, validate=True):
+            return self.issues[start:start + size], len(self.issues)
+        self.bridge.search_page = mock.Mock(side_effect=search_page)
+
+    def test_pages_through_all_results(self):
+        issues = list(self.bridge.search_issues_jql("project=TP"))
+        self.assertEqual([k["key"] for k in issues], self.issues)
+        self.assertEqual(self.bridge.search_page.call_count, 3)
+
+    def test_limit(self):
+        issues = list(self.bridge.search_issues_jql("project=TP", limit=120))
+        self.assertEqual(len(issues), 120)
+        self.assertEqual(
+            [c[0][1:] for c in self.bridge.search_page.call_args_list], [(0, 100), (100, 20)]
+        )
+
+    def test_streams_pages(self):
+        issues = self.bridge.search_issues_jql("project=TP")
+        self.assertEqual(next(issues)["key"], "TP-0")
+        self.assertEqual(self.bridge.search_page.call_count, 1)
+
+    def test_server_capped_page_size(self):
+        search = self.bridge.search_page.side_effect
+        self.bridge.search_page.side_effect = (
+            lambda query, start, size, fields=None: search(query, start, min(size, 30))
+        )
+        issues = list(self.bridge.search_issues_jql("project=TP"))
+        self.assertEqual([k["key"] for k in issues], self.issues)
+
+    def test_concurrent_prefetch_in_order(self):
+        self.bridge.config.search_concurrency = "3"
+        self.issues = ["TP-%d" % i for i in range(1000)]
+        search = self.bridge.search_page.side_effect
+        lock = threading.Lock()
+        state = {"running": 0, "max": 0}
+
+        def slow_search(query, start, size, fields=None):
+            with lock:
+                state["running"] += 1
+                state["max"] = max(state["max"], state["running"])
+            time.sleep(random.random() / 100)
+            with lock:
+                state["running"] -= 1
+            return search(query, start, size)
+        self.bridge.search_page.side_effect = slow_search
+        issues = list(self.bridge.search_issues_jql("project=TP"))
+        self.assertEqual([k["key"] for k in issues], self.issues)
+        self.assertTrue(1 < state["max"] <= 3)
+
+    def test_concurrency_option(self):
+        self.assertEqual(self.bridge.concurrency, 4)
+        self.bridge.config.search_concurrency = "1"
+        self.assertEqual(self.bridge.concurrency, 1)
+        for value in ("0", "-2", "many"):
+            self.bridge.config.search_concurrency = value
+            self.assertRaises(UsageError, getattr, self.bridge, "concurrency")
+
+
+class GetIssuesTests(BridgeTestCase):
+    def setUp(self):
+        super(GetIssuesTests, self).setUp()
+        self.bridge.config.search_concurrency = "3"
+        self.bridge.jira = mock.Mock()
+        self.bridge.clean_issue = lambda issue: {"key": issue.key}
+        self.bridge.clean_raw_issue = lambda issue: {"key": issue["key"]}
+        self.existing = set("TP-%d" % i for i in range(300))
+
+        def search_page(query, start, size, fields=None, validate=True):
+            keys = [k.strip('"') for k in query[len("key in ("):-1].split(",")]
+            self.assertFalse(validate)
+            self.assertEqual((start, size), (0, len(keys)))
+            time.sleep(random.random() / 100)
+            return [{"key": k.upper()} for k in keys if k.upper() in self.existing], None
+        self.bridge.search_page = mock.Mock(side_effect=search_page)
+        self.bridge.jira.issue.side_effect = JIRAError(404)
+
+    def test_batched_in_order(self):
+        ids = ["TP-%d" % i for i in reversed(range(300))]
+        self.assertEqual([k["key"] for k in self.bridge.get_issues(ids)], ids)
+        self.assertEqual(self.bridge.search_page.call_count, 6)
+        self.assertEqual(self.bridge.jira.issue.call_count, 0)
+
+    def test_streams_batches(self):
+        issues = self.bridge.get_issues(["TP-%d" % i for i in range(300)])
+        self.assertEqual(next(issues)["key"], "TP-0")
+        self.assertTrue(self.bridge.search_page.call_count <= 4)
+
+    def test_unmatched_ids(self):
+        self.bridge.jira.issue.side_effect = lambda key: mock.Mock(key="XP-1") if key == "OLD-1" else None
+        issues = self.bridge.get_issues(["tp-2", "OLD-1", "NOPE-1", "TP-1"])
+        self.assertEqual([k["key"] for k in issues], ["TP-2", "XP-1", "TP-1"])
+        self.assertEqual(
+            [c[0][0] for c in self.bridge.jira.issue.call_args_list], ["OLD-1", "NOPE-1"]
+        )
+
+    def test_failed_search(self):
+        self.bridge.search_page.side_effect = JIRAError(400)
+        self.bridge.jira.issue.side_effect = lambda key: mock.Mock(key=key)
+        issues = self.bridge.get_issues(["TP-1", "TP-2"])
+        self.assertEqual([k["key"] for k in issues], ["TP-1", "TP-2"])
+
+    def test_concurrent_single_fetches(self):
+        lock = threading.Lock()
+        state = {"running": 0, "max": 0}
+
+        def get_issue(key, fields=None):
+            with lock:
+                state["running"] += 1
+                state["max"] = max(state["max"], state["running"])
+            time.sleep(random.random() / 100)
+            with lock:
+                state["running"] -= 1
+            return None if key == "TP-3" else {"key": key}
+        self.bridge.get_issue = get_issue
+        ids = ["TP-%d" % i for i in range(40)]
+        issues = JiraBridge.get_issues(self.bridge, ids)
+        self.assertEqual([k["key"] for k in issues], [k for k in ids if k != "TP-3"])
+        self.assertTrue(1 < state["max"] <= 3)
+
+
+class CommentTests(BridgeTestCase):
+    def setUp(self):
+        super(CommentTests, self).setUp()
+        self.bridge.jira = mock.Mock()
+
+    def test_comments_from_search(self):
+        issue = Issue({}, None, {
+            "key": "TP-1", "id": "1",
+            "fields": {
+                "issuetype": {"id": "1", "name": "Bug", "self": "http://jira.local/rest/api/2/issuetype/1"},
+                "comment": {
+                    "comments": [{
+                        "self": "http://jira.local/rest/api/2/issue/1/comment/1",
+                        "author": {"name": "bob", "displayName": "Bob",
+                                   "self": "http://jira.local/rest/api/2/user?username=bob"},
+                        "body": "hello", "created": "today"
+                    }],
+                    "total": 1
+                }
+            }
+        })
+        cleaned = self.bridge.clean_issue(issue)
+        self.assertEqual(cleaned["comments"], [{"author": "Bob", "body": "hello", "created": "today"}])
+        self.bridge.add_comments([cleaned])
+        self.assertEqual(self.bridge.jira.comments.call_count, 0)
+
+    def test_add_comments(self):
+        self.bridge.get_issue_comments = mock.Mock(side_effect=lambda key: [{"body": key}])
+        issues = [{"key": "TP-%d" % i} for i in range(20)] + [{"key": "TP-20", "comments": []}]
+        self.bridge.add_comments(issues)
+        self.assertEqual(self.bridge.get_issue_comments.call_count, 20)
+        self.assertEqual([k["comments"] for k in issues[:20]], [[{"body": k["key"]}] for k in issues[:20]])
+        self.assertEqual(issues[20]["comments"], [])
+
+
+class CleanIssueTests(BridgeTestCase):
+    RAW = {
+        "key": "TP-2", "id": "2",
+        "fields": {
+            "issuetype": {"id": "5", "name": "Sub-task", "self": "http://jira.local/rest/api/2/issuetype/5"},
+            "status": {"id": "3", "name": "Open", "self": "http://jira.local/rest/api/2/status/3"},
+            "priority": {"id": "2", "name": "Major", "self": "http://jira.local/rest/api/2/priority/2"},
+            "assignee": {"name": "alice", "displayName": "Alice",
+                         "self": "http://jira.local/rest/api/2/user?username=alice"},
+            "parent": {"id": "1", "key": "TP-1", "self": "http://jira.local/rest/api/2/issue/1"},
+            "project": {"id": "10", "key": "TP", "name": "Test", "self": "http://jira.local/rest/api/2/project/10"},
+            "components": [{"id": "7", "name": "core", "self": "http://jira.local/rest/api/2/component/7"}],
+            "fixVersions": [{"id": "8", "name": "1.0", "self": "http://jira.local/rest/api/2/version/8"}],
+            "progress": {"progress": 1, "total": 2},
+            "labels": ["a", "b"],
+            "summary": "second",
+            "resolution": None,
+            "worklog": {"self": "http://jira.local/rest/api/2/issue/2/worklog", "total": 0},
+        }
+    }
+
+    def test_same_as_resources(self):
+        cleaned = self.bridge.clean_raw_issue(self.RAW)
+        fields = Issue({}, None, self.RAW).fields
+        self.assertEqual(
+            dict((k, v) for k, v in cleaned.items() if not isinstance(v, (dict, list))),
+            {"key": "TP-2", "type": "5", "issuetype": "5", "status": "3", "priority": "2",
+             "assignee": "alice", "parent": "TP-1", "summary": "second"}
+        )
+        self.assertNotIn("resolution", cleaned)
+        for field in ["project", "components", "fixVersions", "progress", "labels", "worklog"]:
+            self.assertEqual(plain_value(cleaned[field]), plain_value(getattr(fields, field)))
+        self.assertEqual(str(cleaned["project"]), str(fields.project))
+        self.assertEqual(cleaned["progress"].total, 2)
+        self.assertEqual(self.bridge.format_field(cleaned, "fixversions"), "1.0")
+
+
+class ChildrenTests(BridgeTestCase):
+    def test_parent_mapped_to_key(self):
+        self.bridge.jira = mock.Mock()
+        issue = Issue({}, None, {
+            "key": "TP-2", "id": "2",
+            "fields": {
+                "issuetype": {"id": "5", "name": "Sub-task", "self": "http://jira.local/rest/api/2/issuetype/5"},
+                "parent": {"id": "1", "key": "TP-1", "self": "http://jira.local/rest/api/2/issue/1"},
+            }
+        })
+        self.assertEqual(self.bridge.clean_issue(issue)["parent"], "TP-1")
+
+    def test_add_children(self):
+        parents = [{"key": "TP-%d" % i} for i in range(120)]
+        children = [{"key": "TP-%d" % (1000 + i), "parent": "TP-%d" % (i % 3)} for i in range(9)]
+
+        def search(query, fields=None):
+            self.assertEqual(fields, ["summary", "type", "parent"])
+            keys = query[len("parent in ("):-1].split(",")
+            return [child for child in children if child["parent"] in keys]
+        self.bridge.search_issues_jql = mock.Mock(side_effect=search)
+        self.bridge.add_children(parents)
+        self.assertEqual(self.bridge.search_issues_jql.call_count, 3)
+        self.assertEqual([k["key"] for k in parents[1]["children"]], ["TP-1001", "TP-1004", "TP-1007"])
+        self.assertEqual(parents[3]["children"], [])
+
+
+class FieldProjectionTests(BridgeTestCase):
+    def setUp(self):
+        super(FieldProjectionTests, self).setUp()
+        self.bridge.jira = mock.Mock()
+        self.bridge.jira._get_url.side_effect = lambda path: "http://jira.local/rest/api/2/" + path
+        self.bridge.jira._session.get.return_value.content = b'{"issues": [], "total": 0}'
+
+    def test_display_fields(self):
+        self.assertEqual(self.bridge.display_fields(-1), ["summary", "status"])
+        self.assertIn("comments", self.bridge.display_fields(0, comments_only=True))
+        self.assertEqual(self.bridge.display_fields(3), self.bridge.display_fields(2))
+        self.assertEqual(
+            self.bridge.display_fields(1, formatter="%key: %Summary [%type]"), ["summary", "type"]
+        )
+
+    def test_search_fields(self):
+        list(self.bridge.search_issues_jql("project=TP", fields=["summary", "comments", "fixversions"]))
+        self.assertEqual(
+            self.bridge.jira._session.get.call_args[1]["params"]["fields"],
+            "comment,fixVersions,issuetype,summary"
+        )
+        list(self.bridge.search_issues_jql("project=TP"))
+        self.assertEqual(self.bridge.jira._session.get.call_args[1]["params"]["fields"], "*all")
+
+    def test_projected_issue_cleaned(self):
+        issue = Issue({}, None, {
+            "key": "TP-1", "id": "1",
+            "fields": {
+                "issuetype": {"id": "5", "name": "Bug", "self": "http://jira.local/rest/api/2/issuetype/5"},
+                "summary": "first",
+            }
+        })
+        self.assertEqual(
+            self.bridge.clean_issue(issue), {"key": "TP-1", "summary": "first", "issuetype": "5", "type": "5"}
+        )
+
+
+class FormatTests(BridgeTestCase):
+    def setUp(self):
+        super(FormatTests, self).setUp()
+        self.bridge.get_statuses = lambda: {"open": {"id": "1", "name": "Open"}}
+        self.bridge.get_priorities = lambda: {"major": {"id": "3", "name": "Major"}}
+        self.bridge.get_issue_types = lambda: {"bug": {"id": "1", "name": "Bug"}}
+        self.bridge.get_subtask_issue_types = lambda: {"sub-task": {"id": "5", "name": "Sub-task"}}
+        self.issue = {"key": "TP-1", "keyword": "kw", "status": "1", "priority": "3",
+                      "type": "5", "summary": "a summary"}
+
+    def test_template_segments(self):
+        template = FormatTemplate("[%key] %Summary!")
+        self.assertEqual(template.segments, [("[", "key"), ("] ", "summary")])
+        self.assertEqual(template.tail, "!")
+        self.assertEqual(template.fields, ["key", "summary"])
+
+    def test_format(self):
+        self.assertEqual(
+            self.bridge.format_issue(self.issue, formatter="%key %status %priority %type: %summary"),
+            "TP-1 Open Major Sub-task: a summary"
+        )
+
+    def test_format_shared_prefix(self):
+        template = FormatTemplate("%keyword/%key/%missing")
+        self.assertEqual(self.bridge.format_issue(self.issue, formatter=template), "kw/TP-1/")
+
+    def test_record_value(self):
+        issue = dict(self.issue, lastViewed="today", fixVersions=[{"name": "1.0"}])
+        self.assertEqual(self.bridge.record_value(issue, "status"), "Open")
+        self.assertEqual(self.bridge.record_value(issue, "type"), "Sub-task")
+        self.assertEqual(self.bridge.record_value(issue, "lastviewed"), "today")
+        self.assertEqual(self.bridge.record_value(issue, "fixversions"), [{"name": "1.0"}])
+        self.assertEqual(self.bridge.format_field(issue, "lastviewed"), "today")
+        self.assertIsNone(self.bridge.record_value({"key": "TP-2"}, "status"))
+
+
+class RecordingHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.server.requests.append((self.client_address, self.path))
+        body = self.server.bodies.get(
+            self.path, b"[]" if self.path.endswith("/priority") else b"{}"
+        )
+        cookie = self.headers.get("Cookie", "")
+        etag = self.server.etags.get(self.path)
+        self.server.conditions.append(self.headers.get("If-None-Match"))
+        if etag and self.headers.get("If-None-Match") == etag:
+            body = b""
+            self.send_response(304)
+        elif self.path in self.server.redirects:
+            self.send_response(301)
+            self.send_header("Location", self.server.redirects[self.path])
+        elif self.headers.get("Authorization"):
+            self.server.logins.append(self.path)
+            self.send_response(200)
+            self.server.sessions.append("session%d" % len(self.server.logins))
+            self.send_header("Set-Cookie", "JSESSIONID=%s; Path=/" % self.server.sessions[-1])
+        elif self.server.sessions and cookie == "JSESSIONID=%s" % self.server.sessions[-1]:
+            self.send_response(200)
+        elif self.server.require_auth:
+            body = b"{}"
+            self.send_response(401)
+        else:
+            self.send_response(200)
+        if etag:
+            self.send_header("ETag", etag)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class RecordingServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class LocalServerTestCase(unittest.TestCase):
+    def setUp(self):
+        jiracli.cache.CACHE_DIR = tempfile.mkdtemp()
+        self.server = RecordingServer(("127.0.0.1", 0), RecordingHandler)
+        self.server.requests = []
+        self.server.redirects = {}
+        self.server.logins = []
+        self.server.sessions = []
+        self.server.require_auth = False
+        self.server.bodies = {}
+        self.server.etags = {}
+        self.server.conditions = []
+        self.url = "http://%s:%d" % self.server.server_address
+        thread = threading.Thread(target=self.server.serve_forever, args=(0.01,))
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class ConnectionReuseTests(LocalServerTestCase):
+    def test_connection_reused(self):
+        bridge = JiraRestBridge(self.url, Config(tempfile.mktemp()))
+        bridge.login(basic_auth=("user", "password"))
+        bridge.jira.priorities()
+        RequestsTransport(get_session()).open(Request(self.url + "/rpc/soap/jirasoapservice-v2?wsdl"))
+        self.assertEqual(
+            [path for _, path in self.server.requests],
+            ["/", "/rest/api/2/priority", "/rpc/soap/jirasoapservice-v2?wsdl"]
+        )
+        self.assertEqual(len(set(address for address, _ in self.server.requests)), 1)
+
+
+class RedirectTests(LocalServerTestCase):
+    def test_redirect_resolved_once(self):
+        self.server.redirects["/jira"] = "https://jira.example.com/jira/secure/Dashboard.jspa"
+        for _ in range(3):
+            bridge = JiraRestBridge(self.url + "/jira", Config(tempfile.mktemp()))
+            self.assertEqual(bridge.base_url, "https://jira.example.com/jira")
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_path_redirect_ignored(self):
+        self.server.redirects["/"] = "/secure/Dashboard.jspa"
+        bridge = JiraRestBridge(self.url + "/", Config(tempfile.mktemp()))
+        self.assertEqual(bridge.base_url, self.url + "/")
+        JiraRestBridge(self.url + "/", Config(tempfile.mktemp()))
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_unreachable_not_cached(self):
+        with mock.patch("jiracli.bridge.get_session") as session:
+            session.return_value.get.side_effect = RequestException()
+            for _ in range(2):
+                bridge = JiraRestBridge(self.url, Config(tempfile.mktemp()))
+                self.assertEqual(bridge.base_url, self.url)
+            self.assertEqual(session.return_value.get.call_count, 2)
+
+
+class SessionResumeTests(LocalServerTestCase):
+    def setUp(self):
+        super(SessionResumeTests, self).setUp()
+        self.server.require_auth = True
+        self.config = Config(tempfile.mktemp())
+        self.config.username = "user"
+
+    def login(self, user="user"):
+        bridge = JiraRestBridge(self.url, self.config)
+        bridge.login(basic_auth=(user, "password"))
+        return bridge
+
+    def test_resume_without_credentials(self):
+        self.login().jira.priorities()
+        bridge = JiraRestBridge(self.url, self.config)
+        self.assertTrue(bridge.resume())
+        bridge.jira.priorities()
+        self.assertEqual(self.server.logins, ["/rest/api/2/priority"])
+        self.assertEqual(
+            [path for _, path in self.server.requests],
+            ["/", "/rest/api/2/priority", "/rest/api/2/priority"]
+        )
+
+    def test_no_session_to_resume(self):
+        self.assertFalse(JiraRestBridge(self.url, self.config).resume())
+        self.login("other").jira.priorities()
+        self.assertFalse(JiraRestBridge(self.url, self.config).resume())
+
+    def test_expired_session_reauthenticates(self):
+        self.login().jira.priorities()
+        bridge = JiraRestBridge(self.url, self.config)
+        self.assertTrue(bridge.resume())
+        bridge.reauthenticate = mock.Mock(side_effect=self.login)
+        # the server forgets the session handed out to the first login.
+        self.server.sessions.append("restarted")
+        self.assertEqual(bridge.jira.priorities(), [])
+        self.assertEqual(bridge.reauthenticate.call_count, 1)
+        self.assertEqual(
+            self.server.logins, ["/rest/api/2/priority", "/rest/api/2/priority"]
+        )
+        bridge.jira.priorities()
+        self.assertEqual(bridge.reauthenticate.call_count, 1)
+        self.assertEqual(
+            JiraRestBridge(self.url, self.config).load_session()["cookies"],
+            {"JSESSIONID": self.server.sessions[-1]}
+        )
+
+    def test_session_kept_out_of_cache(self):
+        bridge = self.login()
+        bridge.jira.priorities()
+        self.assertEqual(os.stat(bridge.session_path).st_mode & 0o777, 0o600)
+        self.assertNotIn("session", jiracli.cache.stats())
+        jiracli.cache.clear_cache()
+        self.assertTrue(JiraRestBridge(self.url, self.config).resume())
+        bridge.clear_session()
+        self.assertFalse(JiraRestBridge(self.url, self.config).resume())
+
+
+class LeanSearchTests(LocalServerTestCase):
+    def test_search_over_session(self):
+        issue = {
+            "key": "TP-1", "id": "1",
+            "fields": {
+                "issuetype": {"id": "1", "name": "Bug", "self": "http://jira.local/rest/api/2/issuetype/1"},
+                "summary": "first",
+            }
+        }
+        self.server.bodies["/rest/api/2/search?jql=project%3DTP&startAt=0&maxResults=100&fields=%2Aall"] = (
+            json.dumps({"issues": [issue], "total": 1}).encode("utf-8")
+        )
+        bridge = JiraRestBridge(self.url, Config(tempfile.mktemp()))
+        bridge.login(basic_auth=("user", "password"))
+        self.assertEqual(
+            list(bridge.search_issues_jql("project=TP")),
+            [{"key": "TP-1", "issuetype": "1", "type": "1", "summary": "first"}]
+        )
+        # no other requests (e.g. for the field names) are made.
+        self.assertEqual(
+            [path for _, path in self.server.requests if path.startswith("/rest")],
+            self.server.logins
+        )
+        self.assertEqual(len(self.server.logins), 1)
+
+    def test_errors_raised(self):
+        self.server.require_auth = True
+        bridge = JiraRestBridge(self.url, Config(tempfile.mktemp()))
+        bridge.login()
+        self.assertRaises(JIRAError, list, bridge.search_issues_jql("project=TP"))
+
+
+class RevalidationTests(LocalServerTestCase):
+    def setUp(self):
+        super(RevalidationTests, self).setUp()
+        self.priorities = "/rest/api/2/priority"
+        self.server.bodies[self.priorities] = (
+            b'[{"id": "1", "name": "Major", "self": "http://jira.local/rest/api/2/priority/1"}]'
+        )
+        self.bridge = JiraRestBridge(self.url, Config(tempfile.mktemp()))
+        self.bridge.login(basic_auth=("user", "password"))
+
+    def expire(self):
+        jiracli.cache.connect().execute("UPDATE entries SET timestamp = 0")
+        jiracli.cache.connect().commit()
+        jiracli.cache.CachedData.memo.clear()
+
+    def priority_conditions(self):
+        return [
+            condition for (_, path), condition in zip(self.server.requests, self.server.conditions)
+            if path == self.priorities
+        ]
+
+    def test_not_modified(self):
+        self.server.etags[self.priorities] = '"v1"'
+        self.assertEqual(list(self.bridge.get_priorities()), ["major"])
+        self.expire()
+        self.assertEqual(list(self.bridge.get_priorities()), ["major"])
+        # renewed by the 304, so not fetched again.
+        jiracli.cache.CachedData.memo.clear()
+        self.assertEqual(list(self.bridge.get_priorities()), ["major"])
+        self.assertEqual(self.priority_conditions(), [None, '"v1"'])
+
+    def test_modified(self):
+        self.server.etags[self.priorities] = '"v1"'
+        self.bridge.get_priorities()
+        self.server.etags[self.priorities] = '"v2"'
+        self.server.bodies[self.priorities] = (
+            b'[{"id": "2", "name": "Minor", "self": "http://jira.local/rest/api/2/priority/2"}]'
+        )
+        self.expire()
+        self.assertEqual(list(self.bridge.get_priorities()), ["minor"])
+        self.expire()
+        self.bridge.get_priorities()
+        self.assertEqual(self.priority_conditions(), [None, '"v1"', '"v2"'])
+
+    def test_without_validators(self):
+        self.bridge.get_priorities()
+        self.expire()
+        self.bridge.get_priorities()
+        self.assertEqual(self.priority_conditions(), [None, None])
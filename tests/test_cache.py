@@ -1,8 +1,64 @@
+import multiprocessing
 import os
+import pickle
+import sqlite3
+import time
 import unittest
 import tempfile
 import hiro
+import mock
 import jiracli.cache
+from jiracli.bridge.soap import AtomicObjectCache
+
+PAYLOAD_SIZE = 50000
+
+
+def payload(version):
+    return {"version": version, "items": [version] * PAYLOAD_SIZE}
+
+
+def consistent(data):
+    return data["items"] == [data["version"]] * PAYLOAD_SIZE
+
+
+def write_entries(cache_dir, count):
+    jiracli.cache.CACHE_DIR = cache_dir
+    for version in range(count):
+        jiracli.cache.CachedData("shared").update(payload(version))
+        AtomicObjectCache(os.path.join(cache_dir, "wsdl")).put("shared", payload(version))
+
+
+def read_entries(cache_dir, count):
+    jiracli.cache.CACHE_DIR = cache_dir
+    torn = 0
+    for _ in range(count):
+        jiracli.cache.CachedData.memo.clear()
+        for data in (
+            jiracli.cache.CachedData("shared").get(),
+            AtomicObjectCache(os.path.join(cache_dir, "wsdl")).get("shared")
+        ):
+            if data is None or not consistent(data):
+                torn += 1
+    return torn
+
+
+@jiracli.cache.cached("upstream")
+def upstream(calls_path):
+    with open(calls_path, "a") as calls:
+        calls.write("x")
+    time.sleep(0.2)
+    return {"value": 1}
+
+
+def call_upstream(cache_dir, calls_path):
+    jiracli.cache.CACHE_DIR = cache_dir
+    return upstream(calls_path)
+
+
+def call_expired_upstream(cache_dir, calls_path, start):
+    jiracli.cache.CACHE_DIR = cache_dir
+    time.sleep(max(0, start - time.time()))
+    return upstream(calls_path)
 
 
 class CacheTests(unittest.TestCase):
@@ -27,9 +83,45 @@ class CacheTests(unittest.TestCase):
         data.update({"foo":"bar"})
         self.assertTrue(os.path.isfile(data.path))
         jiracli.cache.clear_cache(data)
-        self.assertFalse(os.path.isfile(data.path))
+        jiracli.cache.CachedData.memo.clear()
+        self.assertEqual(jiracli.cache.CachedData("foobar").get(), None)
         jiracli.cache.clear_cache()
         self.assertFalse(os.path.isdir(self.cache_dir))
+        self.assertEqual(jiracli.cache.CachedData("foobar").get(), None)
+
+    def test_clear_namespace(self):
+        jiracli.cache.CachedData("foo1", namespace="foo").update(1)
+        jiracli.cache.CachedData("foo2", namespace="foo").update(2)
+        jiracli.cache.CachedData("bar1", namespace="bar").update(3)
+        self.assertEqual(jiracli.cache.clear_namespace("foo"), 2)
+        self.assertEqual(jiracli.cache.CachedData("foo1").get(), None)
+        self.assertEqual(jiracli.cache.CachedData("foo2").get(), None)
+        self.assertEqual(jiracli.cache.CachedData("bar1").get(), 3)
+
+    def test_single_file(self):
+        for i in range(10):
+            jiracli.cache.CachedData("foo%d" % i).update(i)
+        # along with the write-ahead log of the open connection.
+        self.assertEqual(
+            set(os.listdir(self.cache_dir)) - set(["cache.db-wal", "cache.db-shm"]), set([jiracli.cache.CACHE_FILE])
+        )
+        for name in os.listdir(self.cache_dir):
+            self.assertEqual(os.stat(os.path.join(self.cache_dir, name)).st_mode & 0o777, 0o600)
+        connection = jiracli.cache.connect()
+        self.assertEqual(connection.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        self.assertEqual(connection.execute("PRAGMA synchronous").fetchone()[0], 1)
+
+    def test_size_bound(self):
+        with mock.patch("jiracli.cache.CACHE_SIZE", 2500):
+            with hiro.Timeline().freeze() as timeline:
+                for i in range(5):
+                    jiracli.cache.CachedData("foo%d" % i).update("x" * 1000)
+                    timeline.forward(1)
+        jiracli.cache.CachedData.memo.clear()
+        self.assertEqual(
+            [jiracli.cache.CachedData("foo%d" % i).get() is not None for i in range(5)],
+            [False, False, False, True, True]
+        )
 
     def test_decorated(self):
         @jiracli.cache.cached("foo")
@@ -39,4 +131,266 @@ class CacheTests(unittest.TestCase):
         self.assertEqual(func(1,2), func(1,2))
         self.assertNotEqual(func(1,2), func(3,4))
 
-        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+        self.assertEqual(
+            jiracli.cache.connect().execute(
+                "SELECT COUNT(*) FROM entries WHERE namespace = 'foo'"
+            ).fetchone()[0], 2
+        )
+
+    def test_memoized_disk_reads(self):
+        jiracli.cache.CachedData("foobar").update({"foo": "bar"})
+        jiracli.cache.CachedData.memo.clear()
+        with mock.patch("jiracli.cache.pickle.loads",
+                        wraps=jiracli.cache.pickle.loads) as loads:
+            for _ in range(100):
+                self.assertEqual(jiracli.cache.CachedData("foobar").get(),
+                                 {"foo": "bar"})
+            self.assertEqual(loads.call_count, 1)
+
+    def test_stale_while_revalidate(self):
+        calls = []
+
+        @jiracli.cache.cached("foo")
+        def func(a):
+            calls.append(a)
+            return {"value": len(calls)}
+
+        with hiro.Timeline().freeze() as timeline:
+            self.assertEqual(func(1), {"value": 1})
+            timeline.forward(1 + 60*60*24)
+            name, = [
+                name for path, name in jiracli.cache.CachedData.memo
+                if path == jiracli.cache.CachedData("foo").path
+            ]
+            with jiracli.cache.CachedData(name).lock():
+                self.assertEqual(func(1), {"value": 1})
+            self.assertEqual(calls, [1])
+            self.assertEqual(func(1), {"value": 2})
+            self.assertEqual(func(1), {"value": 2})
+            self.assertEqual(calls, [1, 1])
+
+    def test_stale_served_on_failure(self):
+        calls = []
+
+        @jiracli.cache.cached("foo")
+        def func(a):
+            calls.append(a)
+            if len(calls) > 1:
+                raise IOError("unreachable")
+            return {"value": len(calls)}
+
+        with hiro.Timeline().freeze() as timeline:
+            self.assertEqual(func(1), {"value": 1})
+            timeline.forward(1 + 60*60*24)
+            self.assertEqual(func(1), {"value": 1})
+            self.assertEqual(calls, [1, 1])
+            self.assertRaises(IOError, func, 2)
+
+    def test_namespace_durations(self):
+        calls = []
+
+        @jiracli.cache.cached("short", 10)
+        def short():
+            calls.append("short")
+            return {"value": len(calls)}
+
+        @jiracli.cache.cached("long", 100)
+        def long():
+            calls.append("long")
+            return {"value": len(calls)}
+
+        self.addCleanup(jiracli.cache.DURATION_OVERRIDES.clear)
+        with hiro.Timeline().freeze() as timeline:
+            short(), long()
+            timeline.forward(11)
+            short(), long()
+            self.assertEqual(calls, ["short", "long", "short"])
+            jiracli.cache.configure({"short": "100", "long": "10"})
+            timeline.forward(11)
+            short(), long()
+            self.assertEqual(calls, ["short", "long", "short", "long"])
+
+    def test_schema_upgrade(self):
+        path = jiracli.cache.CachedData("foo").path
+        connection = sqlite3.connect(path)
+        connection.execute(
+            "CREATE TABLE entries ("
+            "key TEXT PRIMARY KEY, namespace TEXT, timestamp REAL, size INTEGER, data BLOB)"
+        )
+        connection.execute(
+            "INSERT INTO entries VALUES ('foo', 'foo', ?, 1, ?)",
+            (time.time(), sqlite3.Binary(pickle.dumps("bar")))
+        )
+        connection.execute(
+            "INSERT INTO entries VALUES ('session1a2b', 'session', ?, 1, ?)",
+            (time.time(), sqlite3.Binary(pickle.dumps({"cookies": {}})))
+        )
+        connection.execute("PRAGMA user_version=1")
+        connection.commit()
+        connection.close()
+        self.assertEqual(jiracli.cache.CachedData("foo").get(), "bar")
+        jiracli.cache.CachedData("foo").update("baz", validators={"url": {"If-None-Match": "1"}})
+        jiracli.cache.CachedData.memo.clear()
+        data = jiracli.cache.CachedData("foo")
+        self.assertEqual(data.get(), "baz")
+        self.assertEqual(data.validators, {"url": {"If-None-Match": "1"}})
+        self.assertIsNone(jiracli.cache.CachedData("session1a2b").get())
+
+    def test_concurrent_migrations(self):
+        path = os.path.join(self.cache_dir, "concurrent.db")
+        first, second = sqlite3.connect(path), sqlite3.connect(path)
+        jiracli.cache.migrate(first, path)
+        jiracli.cache.migrate(second, path)
+        self.assertEqual(second.execute("PRAGMA user_version").fetchone()[0],
+                         jiracli.cache.SCHEMA_VERSION)
+        self.assertEqual(second.isolation_level, "")
+
+    def test_legacy_files_removed(self):
+        for name in ("statuses1a2b.cache", "filters3c4d.cache"):
+            with open(os.path.join(self.cache_dir, name), "wb") as fp:
+                fp.write(pickle.dumps({"foo": "bar"}))
+        os.makedirs(os.path.join(self.cache_dir, "wsdl"))
+        jiracli.cache.CachedData("foo").update("bar")
+        self.assertEqual(
+            sorted(set(os.listdir(self.cache_dir)) - set(["cache.db-wal", "cache.db-shm"])), ["cache.db", "wsdl"]
+        )
+
+    def test_key_stable(self):
+        calls = []
+
+        @jiracli.cache.cached("foo")
+        def func(**kwargs):
+            calls.append(kwargs)
+            return {"value": len(calls)}
+
+        kwargs = dict(("key%d" % i, i) for i in range(20))
+        self.assertEqual(func(**kwargs), {"value": 1})
+        self.assertEqual(func(**dict(reversed(list(kwargs.items())))), {"value": 1})
+        self.assertEqual(
+            jiracli.cache.cache_key(("a",), {"b": 1, "c": 2}),
+            jiracli.cache.cache_key(("a",), {"c": 2, "b": 1})
+        )
+        self.assertNotEqual(
+            jiracli.cache.cache_key(("a", "b"), {}), jiracli.cache.cache_key(("ab",), {})
+        )
+
+    def test_scoped_key(self):
+        first, second = mock.Mock(cache_scope="rest url alice"), mock.Mock(cache_scope="rest url bob")
+        self.assertEqual(
+            jiracli.cache.cache_key((first, 1), {}),
+            jiracli.cache.cache_key((mock.Mock(cache_scope="rest url alice"), 1), {})
+        )
+        self.assertNotEqual(
+            jiracli.cache.cache_key((first, 1), {}), jiracli.cache.cache_key((second, 1), {})
+        )
+        self.assertEqual(jiracli.cache.cache_key((first, 1), {})[0], "rest url alice")
+
+    def test_decorated_memoized(self):
+        calls = []
+
+        @jiracli.cache.cached("foo")
+        def func(a):
+            calls.append(a)
+            return {"value": a}
+
+        with mock.patch("jiracli.cache.pickle.loads") as loads:
+            for _ in range(100):
+                self.assertEqual(func(1), {"value": 1})
+            self.assertEqual(loads.call_count, 0)
+        self.assertEqual(calls, [1])
+
+    def test_stats(self):
+        calls = []
+
+        @jiracli.cache.cached("foo", 60)
+        def func(a):
+            calls.append(a)
+            return {"value": a}
+
+        with hiro.Timeline().freeze() as timeline:
+            func(1), func(1), func(2)
+            timeline.forward(61)
+            func(1)
+            jiracli.cache.CachedData("bar1", namespace="bar").update("x" * 100)
+            stats = jiracli.cache.stats()
+        self.assertEqual(calls, [1, 2, 1])
+        self.assertEqual(
+            (stats["foo"]["entries"], stats["foo"]["hits"], stats["foo"]["misses"],
+             stats["foo"]["refreshes"], stats["foo"]["duration"], int(stats["foo"]["age"])),
+            (2, 1, 3, 3, 60, 61)
+        )
+        self.assertEqual(stats["bar"]["entries"], 1)
+        self.assertEqual(stats["bar"]["hits"], 0)
+        self.assertTrue(stats["bar"]["size"] > 100)
+        # counters of other processes add up, and the duration they
+        # recorded is reported for namespaces this process doesn't know.
+        jiracli.cache.connect().execute(
+            "UPDATE stats SET hits = hits + 10, duration = 30 WHERE namespace = 'foo'"
+        )
+        with mock.patch.dict(jiracli.cache.DURATIONS, clear=True):
+            stats = jiracli.cache.stats()
+        self.assertEqual((stats["foo"]["hits"], stats["foo"]["duration"]), (11, 30))
+
+    def test_stats_flushed_at_exit(self):
+        jiracli.cache.count("foo", jiracli.cache.HIT)
+        path = jiracli.cache.CachedData("foo").path
+        jiracli.cache.CACHE_DIR = tempfile.mkdtemp()
+        jiracli.cache.flush_counters()
+        self.assertEqual(
+            sqlite3.connect(path).execute("SELECT hits FROM stats WHERE namespace = 'foo'").fetchall(),
+            [(1,)]
+        )
+
+
+class MultiProcessCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        jiracli.cache.CACHE_DIR = self.cache_dir
+        self.pool = multiprocessing.Pool(8)
+
+    def tearDown(self):
+        self.pool.terminate()
+        self.pool.join()
+
+    def test_no_torn_reads(self):
+        write_entries(self.cache_dir, 1)
+        writers = [
+            self.pool.apply_async(write_entries, (self.cache_dir, 20)) for _ in range(2)
+        ]
+        readers = [
+            self.pool.apply_async(read_entries, (self.cache_dir, 50)) for _ in range(6)
+        ]
+        for writer in writers:
+            writer.get(60)
+        self.assertEqual([reader.get(60) for reader in readers], [0] * 6)
+
+    def test_single_refresh(self):
+        calls_path = os.path.join(self.cache_dir, "calls")
+        results = [
+            self.pool.apply_async(call_upstream, (self.cache_dir, calls_path)) for _ in range(8)
+        ]
+        self.assertEqual([result.get(60) for result in results], [{"value": 1}] * 8)
+        with open(calls_path) as calls:
+            self.assertEqual(calls.read(), "x")
+
+    def test_single_refresh_of_expired_entry(self):
+        calls_path = os.path.join(self.cache_dir, "calls")
+        upstream(calls_path)
+        os.unlink(calls_path)
+        jiracli.cache.connect().execute(
+            "UPDATE entries SET timestamp = ?, data = ?",
+            (time.time() - jiracli.cache.CACHE_DURATION - 1, pickle.dumps({"value": 0}))
+        )
+        jiracli.cache.connect().commit()
+        start = time.time() + 0.5
+        results = [
+            self.pool.apply_async(call_expired_upstream, (self.cache_dir, calls_path, start))
+            for _ in range(8)
+        ]
+        results = [result.get(60) for result in results]
+        with open(calls_path) as calls:
+            self.assertEqual(calls.read(), "x")
+        # the processes that didn't refresh the entry served the expired
+        # value instead of waiting for the one that did.
+        self.assertIn({"value": 0}, results)
+        self.assertEqual(set(result["value"] for result in results), set([0, 1]))
@@ -1,5 +1,51 @@
+import subprocess
+import sys
+
+import mock
+
 
 def test_basic_import():
     import jiracli.cli
 
 
+def test_protocols_loaded_lazily():
+    out = subprocess.check_output([
+        sys.executable, "-c",
+        "import sys; from jiracli.interface import cli; cli(['--version']);"
+        "print(sorted(m for m in ('jiracli.bridge', 'requests') if m in sys.modules));"
+        "from jiracli.bridge import get_bridge; get_bridge('rest');"
+        "print(sorted(m for m in ('suds', 'jira', 'keyring') if m in sys.modules))"
+    ])
+    assert out.decode("utf-8").strip().splitlines()[-2:] == ["[]", "['jira']"]
+
+
+def test_bridges_importable_from_package():
+    out = subprocess.check_output([
+        sys.executable, "-c",
+        "import sys; from jiracli.bridge import JiraRestBridge, JiraSoapBridge;"
+        "from jiracli.bridge.rest import JiraRestBridge as rest;"
+        "print(JiraRestBridge is rest and JiraSoapBridge.protocol)"
+    ])
+    assert out.decode("utf-8").strip().splitlines()[-1] == "soap"
+
+
+def test_json_loads_without_orjson():
+    out = subprocess.check_output([
+        sys.executable, "-c",
+        "import sys; sys.modules['orjson'] = None;"
+        "from jiracli.utils import json_loads; print(json_loads(b'{\"total\": 1}')['total'])"
+    ])
+    assert out.decode("utf-8").strip().splitlines()[-1] == "1"
+
+
+def test_protocol_python_required():
+    from jiracli.bridge import get_bridge
+    from jiracli.errors import UsageError
+    with mock.patch("sys.version_info", (2, 7, 18)):
+        try:
+            get_bridge("rest-async")
+        except UsageError as e:
+            assert "python 3.6" in str(e)
+        else:
+            assert False, "UsageError not raised"
+        assert get_bridge("rest").protocol == "rest"
@@ -95,7 +95,7 @@ test_alias = view TEST-123
         with mock.patch("jiracli.interface.prompt"):
             with mock.patch("jiracli.interface.initialize") as initialize:
                 cli(["test_alias"])
-                self.assertEqual(initialize.return_value.get_issue.call_count, 1)
+                self.assertEqual(initialize.return_value.get_issues.call_args[0], (["TEST-123"],))
 
     def test_new_subcommand_description_is_none_by_default(self):
         """ Test that the description is None if missing, when adding new issue. """
@@ -120,7 +120,7 @@ class CliInitParsing(unittest.TestCase):
 
     def test_first_run(self):
         with mock.patch("jiracli.interface.prompt") as prompt:
-            with mock.patch("jiracli.bridge.JiraSoapBridge") as bridge:
+            with mock.patch("jiracli.bridge.soap.JiraSoapBridge") as bridge:
                 def prompt_response(msg, *a):
                     if msg.startswith('username'):
                         return 'testuser'
@@ -129,6 +129,7 @@ class CliInitParsing(unittest.TestCase):
                     if msg.startswith('Base'):
                         return 'http://www.foobar.com'
                 bridge.return_value.ping.return_value = False
+                bridge.return_value.resume.return_value = False
                 prompt.side_effect = prompt_response
                 bridge.return_value.ping.assert_call_count(1)
                 bridge.return_value.login.assert_call_count(1)
@@ -136,7 +137,7 @@ class CliInitParsing(unittest.TestCase):
 
     def test_first_run_with_error_and_persist(self):
         with mock.patch("jiracli.interface.prompt") as prompt:
-            with mock.patch("jiracli.bridge.JiraSoapBridge") as bridge:
+            with mock.patch("jiracli.bridge.soap.JiraSoapBridge") as bridge:
                 def prompt_response(msg, *a):
                     if msg.startswith('username'):
                         return 'testuser'
@@ -160,6 +161,7 @@ class CliInitParsing(unittest.TestCase):
                 prompt.side_effect = prompt_response
                 bridge.return_value.login.side_effect = login
                 bridge.return_value.ping.return_value = False
+                bridge.return_value.resume.return_value = False
                 bridge.return_value.ping.assert_call_count(1)
                 bridge.return_value.login.assert_call_count(3)
                 self.assertEqual(bridge.return_value, initialize(self.cfg, persist=True))
@@ -169,22 +171,39 @@ class CliInitParsing(unittest.TestCase):
         self.cfg.password = 'testpass'
         self.cfg.base_url = 'http://www.foobar.com'
         with mock.patch("jiracli.interface.prompt") as prompt:
-            with mock.patch("jiracli.bridge.JiraSoapBridge") as bridge:
+            with mock.patch("jiracli.bridge.soap.JiraSoapBridge") as bridge:
                 prompt.assert_call_count(0)
                 bridge.assert_call_args('testuser', 'testpass')
                 bridge.return_value.login.assert_call_args('testuser', 'testpass')
                 bridge.return_value.ping.return_value = False
+                bridge.return_value.resume.return_value = False
                 bridge.return_value.ping.assert_call_count(1)
                 bridge.return_value.login.assert_call_count(3)
                 self.assertEqual(bridge.return_value, initialize(self.cfg))
 
     def test_soap_token(self):
-        with mock.patch("jiracli.bridge.JiraSoapBridge") as bridge:
+        with mock.patch("jiracli.bridge.soap.JiraSoapBridge") as bridge:
             self.cfg.base_url = 'http://www.foobar.com'
+            bridge.return_value.resume.return_value = False
             bridge.return_value.ping.return_value = True
             bridge.return_value.ping.assert_call_count(1)
             self.assertEqual(bridge.return_value, initialize(self.cfg))
 
+    def test_resumed_session(self):
+        self.cfg.base_url = 'http://www.foobar.com'
+        with mock.patch("jiracli.interface.prompt") as prompt:
+            with mock.patch("jiracli.bridge.soap.JiraSoapBridge") as bridge:
+                bridge.return_value.resume.return_value = True
+                self.assertEqual(bridge.return_value, initialize(self.cfg))
+                self.assertEqual(bridge.return_value.ping.call_count, 0)
+                self.assertEqual(bridge.return_value.login.call_count, 0)
+                self.assertEqual(prompt.call_count, 0)
+                bridge.return_value.resume.return_value = False
+                bridge.return_value.ping.return_value = True
+                reauthenticated = bridge.return_value.reauthenticate()
+                self.assertEqual(bridge.return_value, reauthenticated)
+                self.assertEqual(bridge.return_value.ping.call_count, 1)
+
 
 class BackwardCompatibilityTests(unittest.TestCase):
     def setUp(self):
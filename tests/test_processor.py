@@ -1,7 +1,12 @@
+import csv
+import datetime
+import json
 import unittest
 
 import mock
+import six
 
+from jiracli.bridge import JiraBridge
 from jiracli.interface import build_parser, cli
 
 class AddCommandTests(unittest.TestCase):
@@ -13,3 +18,161 @@ class AddCommandTests(unittest.TestCase):
                     init().get_issue_types.return_value = {'story': 1}
                     cli("new title --type story --project FOO --description bar".split(" "))
 
+
+
+class ViewCommandTests(unittest.TestCase):
+    def test_verbose_comments_fetched_in_batches(self):
+        with mock.patch("jiracli.interface.print_output"):
+            with mock.patch("jiracli.processor.print_output"):
+                with mock.patch("jiracli.interface.initialize") as init:
+                    jira = init()
+                    jira.search_issues_jql.return_value = iter(
+                        [{"key": "TP-%d" % i} for i in range(120)]
+                    )
+                    jira.add_comments.side_effect = lambda issues: issues
+                    cli(["view", "--search-jql", "project=TP", "-v"])
+                    self.assertEqual(
+                        [len(c[0][0]) for c in jira.add_comments.call_args_list],
+                        [50, 50, 20]
+                    )
+                    self.assertEqual(jira.format_issue.call_count, 120)
+                    self.assertEqual(jira.format_issue.call_args[1]["mode"], 1)
+
+    def test_children_fetched_in_batches(self):
+        with mock.patch("jiracli.interface.print_output"):
+            with mock.patch("jiracli.processor.print_output"):
+                with mock.patch("jiracli.interface.initialize") as init:
+                    jira = init()
+                    jira.search_issues_jql.return_value = iter(
+                        [{"key": "TP-%d" % i} for i in range(60)]
+                    )
+                    jira.add_children.side_effect = lambda issues: issues
+                    cli(["view", "--search-jql", "project=TP", "-vv"])
+                    self.assertEqual(
+                        [len(c[0][0]) for c in jira.add_children.call_args_list],
+                        [50, 10]
+                    )
+                    self.assertEqual(jira.add_comments.call_count, 0)
+
+    def test_nothing_prefetched_with_format(self):
+        for args in (["-v"], ["-vv"], ["--comments-only"]):
+            with mock.patch("jiracli.interface.print_output"):
+                with mock.patch("jiracli.processor.print_output"):
+                    with mock.patch("jiracli.interface.initialize") as init:
+                        jira = init()
+                        jira.search_issues_jql.return_value = iter(
+                            [{"key": "TP-%d" % i} for i in range(60)]
+                        )
+                        cli(["view", "--search-jql", "project=TP", "--format", "%key"] + args)
+                        self.assertEqual(jira.format_issue.call_count, 60)
+                        self.assertEqual(jira.add_comments.call_count, 0)
+                        self.assertEqual(jira.add_children.call_count, 0)
+
+    def test_fields_projected(self):
+        for args, fields in (
+            (["--oneline"], ["summary", "status"]),
+            (["--format", "%key %summary %fixVersions"], ["summary", "fixversions"]),
+            (["--output", "csv", "--format", "%key %labels"], ["key", "labels"]),
+            (["--output", "ndjson"], None),
+        ):
+            with mock.patch("sys.stdout", six.StringIO()):
+                with mock.patch("jiracli.interface.initialize") as init:
+                    jira = init()
+                    jira.search_issues_jql.return_value = iter([])
+                    jira.display_fields.side_effect = (
+                        lambda mode, formatter=None, comments_only=False:
+                        JiraBridge.display_fields(jira, mode, formatter, comments_only)
+                    )
+                    cli(["view", "--search-jql", "project=TP"] + args)
+                    self.assertEqual(jira.search_issues_jql.call_args[1]["fields"], fields)
+
+    def run_output(self, *args):
+        stdout = six.StringIO()
+        with mock.patch("sys.stdout", stdout):
+            with mock.patch("jiracli.interface.initialize") as init:
+                jira = init()
+                jira.search_issues_jql.return_value = iter([
+                    {"key": "TP-1", "status": "1", "summary": "first, issue",
+                     "created": datetime.datetime(2014, 8, 30), "labels": ["a", "b"]},
+                    {"key": "TP-2", "status": "6", "summary": "second\tissue",
+                     "fixVersions": [{"id": "1", "name": "1.0"}, {"id": "2", "name": "1.1"}]},
+                ])
+                jira.record_value.side_effect = (
+                    lambda issue, field: JiraBridge.record_value(jira, issue, field)
+                )
+                jira.format_field.side_effect = (
+                    lambda issue, field: {"1": "Open", "6": "Closed"}[issue[field]]
+                )
+                cli(["view", "--search-jql", "project=TP"] + list(args))
+                self.assertEqual(jira.format_issue.call_count, 0)
+        return stdout.getvalue()
+
+    def test_ndjson_output(self):
+        lines = self.run_output("--output", "ndjson").splitlines()
+        self.assertEqual(json.loads(lines[0])["created"], "2014-08-30T00:00:00")
+        self.assertEqual(json.loads(lines[1])["status"], "Closed")
+        lines = self.run_output("--output", "ndjson", "--format", "%key %labels").splitlines()
+        self.assertEqual(json.loads(lines[0]), {"key": "TP-1", "labels": ["a", "b"]})
+        lines = self.run_output("--output", "ndjson", "--format", "%key %fixVersions").splitlines()
+        self.assertEqual(json.loads(lines[0]), {"key": "TP-1", "fixversions": None})
+        self.assertEqual(
+            [v["name"] for v in json.loads(lines[1])["fixversions"]], ["1.0", "1.1"]
+        )
+
+    def test_csv_output(self):
+        rows = list(csv.reader(six.StringIO(
+            self.run_output("--output", "csv", "--format", "%key %status %summary %labels %fixVersions")
+        )))
+        self.assertEqual(rows, [
+            ["key", "status", "summary", "labels", "fixversions"],
+            ["TP-1", "Open", "first, issue", "a, b", ""],
+            ["TP-2", "Closed", "second\tissue", "", "1.0, 1.1"],
+        ])
+
+    def test_tsv_output(self):
+        rows = list(csv.reader(six.StringIO(self.run_output("--output", "tsv")), 'excel-tab'))
+        self.assertEqual(rows[0], ["key", "status", "priority", "type", "summary",
+                                   "assignee", "reporter", "created", "updated"])
+        self.assertEqual(rows[1][:5], ["TP-1", "Open", "", "", "first, issue"])
+
+
+class CacheCommandTests(unittest.TestCase):
+    def test_warm(self):
+        with mock.patch("jiracli.processor.print_output") as output:
+            with mock.patch("jiracli.processor.print_error") as error:
+                with mock.patch("jiracli.interface.initialize") as init:
+                    jira = init()
+                    jira.warm_cache.return_value = iter([
+                        ("get_statuses", None), ("get_filters", ValueError("forbidden"))
+                    ])
+                    with mock.patch("jiracli.interface.print_error") as warning:
+                        cli(["cache", "warm", "--project", "TP", "--project", "XP"])
+                    jira.warm_cache.assert_called_once_with(["TP", "XP"])
+                    self.assertEqual(output.call_count, 1)
+                    self.assertIn("get_filters: forbidden", error.call_args[0][0])
+                    self.assertIn("1 of the cached lookups failed", warning.call_args[0][0])
+
+    def test_stats_without_login(self):
+        stats = {
+            "statuses": {
+                "entries": 1, "size": 2048, "age": 7200, "duration": 604800,
+                "hits": 5, "misses": 1, "refreshes": 1
+            }
+        }
+        with mock.patch("jiracli.processor.print_output") as output:
+            with mock.patch("jiracli.interface.initialize") as init:
+                with mock.patch("jiracli.cache.stats", return_value=stats):
+                    cli(["cache", "stats"])
+                self.assertFalse(init.called)
+        self.assertEqual(
+            output.call_args[0][0].split(), ["statuses", "1", "2048", "2h", "7d", "5", "1", "1"]
+        )
+
+    def test_clear_namespace_without_login(self):
+        with mock.patch("jiracli.processor.print_output") as output:
+            with mock.patch("jiracli.interface.initialize") as init:
+                with mock.patch("jiracli.cache.clear_namespace", return_value=3) as clear:
+                    cli(["cache", "clear", "statuses", "filters"])
+                    clear.assert_called_once_with("statuses", "filters")
+                self.assertFalse(init.called)
+        self.assertIn("removed 3 cached entries", output.call_args[0][0])
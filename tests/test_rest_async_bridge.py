@@ -0,0 +1,153 @@
+"""
+
+"""
+import json
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+import mock
+
+import jiracli
+from jiracli.utils import Config
+from .common_bridge_cases import BridgeTests
+
+try:
+    # the replay server (and the bridge) use syntax of python 3.
+    if sys.version_info < (3, 6):
+        raise ImportError("python 3.6 or later is required")
+    from .replay_server import ReplayServer
+    from jiracli.bridge.rest_async import JiraAsyncRestBridge
+except ImportError:  # pragma: no cover
+    ReplayServer = None
+
+
+@unittest.skipIf(ReplayServer is None, "requires python 3 and aiohttp")
+class AsyncRestBridgeTests(unittest.TestCase, BridgeTests):
+    delay = 0
+
+    def setUp(self):
+        tmp_config = tempfile.mktemp()
+        self.config = Config(tmp_config)
+        jiracli.utils.CONFIG_FILE = tmp_config
+        self.cache_dir = tempfile.mkdtemp()
+        jiracli.cache.CACHE_DIR = self.cache_dir
+        self.config.username = "testuser"
+        self.config.password = "testpassword"
+        self.vcr_directory = "fixtures/rest"
+        self.server = ReplayServer(self.delay)
+        self.bridge = JiraAsyncRestBridge(self.server.url, self.config)
+        self.bridge.login(basic_auth=(self.config.username, self.config.password))
+
+    def tearDown(self):
+        self.bridge.close()
+        self.server.close()
+
+    def cassette(self, name):
+        return self.server.use_cassette(os.path.join(self.vcr_directory, name))
+
+    def test_issue_cleaned(self):
+        with self.cassette("issue.yaml"):
+            issue = self.bridge.get_issue("TP-9")
+        self.assertEqual(issue['key'], "TP-9")
+        self.assertEqual(issue['type'], issue['issuetype'])
+
+    def test_missing_issue(self):
+        with self.cassette("issue.yaml"):
+            self.assertIsNone(self.bridge.get_issue("TP-404"))
+
+    def test_error_raised(self):
+        error = jiracli.errors.jira_error()
+        with self.cassette("issue.yaml"):
+            with self.assertRaises(error) as raised:
+                self.bridge.get_statuses()
+        self.assertEqual(raised.exception.status_code, 404)
+        self.assertEqual(raised.exception.text, "not recorded")
+
+    def test_search_fields(self):
+        with self.cassette("search-jql.yaml"):
+            list(self.bridge.search_issues_jql("summary~jira-cli", fields=['summary']))
+        self.assertEqual(self.server.requests[0][2]['fields'], "issuetype,summary")
+
+    def test_search_pages(self):
+        issues = [{"key": "TP-%d" % i, "fields": {"issuetype": {"id": "1"}}} for i in range(100)]
+        self.server.responses[('GET', '/rest/api/2/search')] = {
+            'status': {'code': 200}, 'headers': {},
+            'body': {'string': json.dumps({"issues": issues, "total": 250}).encode('utf-8')}
+        }
+        self.assertEqual(len(list(self.bridge.search_issues_jql("project=TP"))), 300)
+        self.assertEqual(
+            [(r[2]['startAt'], r[2]['maxResults']) for r in self.server.requests],
+            [("0", "100"), ("100", "100"), ("200", "50")]
+        )
+        self.assertEqual(set(r[2]['fields'] for r in self.server.requests), set(["*all"]))
+
+    def test_expired_session_renewed(self):
+        self.bridge.save_session(cookies={'JSESSIONID': 'expired'})
+        resumed = JiraAsyncRestBridge(self.server.url, self.config)
+        self.assertTrue(resumed.resume())
+        resumed.reauthenticate = mock.Mock(return_value=self.bridge)
+        self.server.require_auth = True
+        try:
+            with self.cassette("status.yaml"):
+                self.assertIsNotNone(resumed.get_statuses())
+        finally:
+            resumed.close()
+        resumed.reauthenticate.assert_called_once_with()
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_get_issues(self):
+        with self.cassette("search-jql.yaml"):
+            issues = list(self.bridge.get_issues(["TP-%d" % i for i in range(120)]))
+        # one search per batch, the keys it didn't match are looked up
+        # (and not found) individually.
+        searches = [r for r in self.server.requests if r[1] == "/rest/api/2/search"]
+        self.assertEqual(len(searches), 3)
+        self.assertEqual(searches[0][2]['validateQuery'], "false")
+        self.assertEqual([issue['key'] for issue in issues], ["TP-10"])
+        self.assertEqual(len(self.server.requests), 3 + 119)
+
+
+@unittest.skipIf(ReplayServer is None, "requires python 3 and aiohttp")
+class InFlightLimitTests(unittest.TestCase):
+    def setUp(self):
+        tmp_config = tempfile.mktemp()
+        self.config = Config(tmp_config)
+        jiracli.utils.CONFIG_FILE = tmp_config
+        jiracli.cache.CACHE_DIR = tempfile.mkdtemp()
+        self.config.search_concurrency = "3"
+        self.server = ReplayServer(delay=0.02)
+        self.bridge = JiraAsyncRestBridge(self.server.url, self.config)
+        self.bridge.login(basic_auth=("testuser", "testpassword"))
+
+    def tearDown(self):
+        self.bridge.close()
+        self.server.close()
+
+    def test_requests_bounded(self):
+        issues = [{'key': "TP-9"} for _ in range(20)]
+        with self.server.use_cassette("fixtures/rest/issue.yaml"):
+            self.server.responses[('GET', '/rest/api/2/issue/TP-9/comment')] = {
+                'status': {'code': 200}, 'headers': {},
+                'body': {'string': b'{"comments": [{"author": {"name": "testuser"},'
+                                   b' "body": "test", "created": "now"}]}'}
+            }
+            self.bridge.add_comments(issues)
+            # the searches aren't recorded, so each issue is looked up.
+            self.assertEqual(len(list(self.bridge.get_issues(["TP-9"] * 200))), 200)
+        self.assertEqual(issues[0]['comments'][0]['author'], "testuser")
+        self.assertEqual(len(self.server.requests), 20 + 4 + 200)
+        self.assertEqual(self.server.max_in_flight, 3)
+
+    def test_requests_bounded_across_threads(self):
+        def view():
+            list(self.bridge.get_issues(["TP-%d" % i for i in range(10)]))
+        threads = [threading.Thread(target=view) for _ in range(4)]
+        with self.server.use_cassette("fixtures/rest/issue.yaml"):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(self.server.max_in_flight, 3)
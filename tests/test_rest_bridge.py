@@ -6,7 +6,7 @@ import tempfile
 import unittest
 
 import jiracli
-from jiracli.bridge import JiraRestBridge
+from jiracli.bridge.rest import JiraRestBridge
 from jiracli.utils import Config
 from .common_bridge_cases import BridgeTests, jiravcr
 
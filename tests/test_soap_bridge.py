@@ -6,8 +6,12 @@ import tempfile
 import unittest
 
 
+import mock
+from suds import WebFault
+
 import jiracli
-from jiracli.bridge import JiraSoapBridge
+from jiracli.bridge.soap import JiraSoapBridge
+from jiracli.bridge.soap import RequestsTransport
 from jiracli.utils import Config
 from .common_bridge_cases import BridgeTests, jiravcr
 
@@ -26,3 +30,68 @@ class SoapBridgeTests(unittest.TestCase, BridgeTests):
             self.bridge = JiraSoapBridge("https://indydevs.atlassian.net",
                                          self.config)
             self.bridge.login(self.config.username, self.config.password)
+
+
+class WsdlCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.config = Config(tempfile.mktemp())
+        jiracli.cache.CACHE_DIR = tempfile.mkdtemp()
+        self.vcr_directory = "fixtures/soap"
+
+    def test_wsdl_cached(self):
+        with jiravcr.use_cassette(os.path.join(self.vcr_directory, "login.yaml")):
+            bridge = JiraSoapBridge("https://indydevs.atlassian.net", self.config)
+            self.assertIsNotNone(bridge.service)
+        with mock.patch.object(RequestsTransport, "open") as fetch:
+            with mock.patch("jiracli.bridge.get_session") as session:
+                session.return_value.get.side_effect = AssertionError("network access")
+                bridge = JiraSoapBridge("https://indydevs.atlassian.net", self.config)
+            self.assertIsNotNone(bridge.service)
+            self.assertEqual(fetch.call_count, 0)
+
+
+class SessionResumeTests(unittest.TestCase):
+    def setUp(self):
+        self.config = Config(tempfile.mktemp())
+        jiracli.cache.CACHE_DIR = tempfile.mkdtemp()
+        self.client_patcher = mock.patch("jiracli.bridge.soap.Client")
+        self.service = self.client_patcher.start().return_value.service
+        self.redirect_patcher = mock.patch("jiracli.bridge.JiraBridge._check_redirect")
+        self.redirect_patcher.start().side_effect = lambda url: url
+        self.service.login.side_effect = ["token1", "token2"]
+        self.config.username = "user"
+        self.service.getIssueTypes.side_effect = AssertionError("ping")
+
+    def tearDown(self):
+        self.client_patcher.stop()
+        self.redirect_patcher.stop()
+
+    def login(self):
+        bridge = JiraSoapBridge("http://jira.local", self.config)
+        bridge.login(auth=("user", "password"))
+        return bridge
+
+    def test_resume(self):
+        self.assertFalse(JiraSoapBridge("http://jira.local", self.config).resume())
+        self.login()
+        bridge = JiraSoapBridge("http://jira.local", self.config)
+        self.assertTrue(bridge.resume())
+        bridge.get_issue_comments("TP-1")
+        self.service.getComments.assert_called_once_with("token1", "TP-1")
+        self.assertEqual(self.service.login.call_count, 1)
+
+    def test_expired_token_reauthenticates(self):
+        self.login()
+        bridge = JiraSoapBridge("http://jira.local", self.config)
+        self.assertTrue(bridge.resume())
+        bridge.reauthenticate = mock.Mock(side_effect=self.login)
+        fault = mock.Mock(faultstring="RemoteAuthenticationException: session timed out")
+        self.service.getComments.side_effect = [WebFault(fault, None), [], []]
+        self.assertEqual(bridge.get_issue_comments("TP-1"), [])
+        bridge.get_issue_comments("TP-2")
+        self.assertEqual(bridge.reauthenticate.call_count, 1)
+        self.assertEqual(
+            self.service.getComments.call_args_list,
+            [mock.call("token1", "TP-1"), mock.call("token2", "TP-1"), mock.call("token2", "TP-2")]
+        )
+        self.assertEqual(bridge.load_session()["token"], "token2")